@@ -0,0 +1,78 @@
+"""
+Per-row cost of a contacts list response, orm objects through the response model against the fast rows path.
+
+Run from the project root: python -m benchmarks.serialization [rows per page ...]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.database.models import Base, Contact, User, birthday_key
+from src.repository import contacts as repository_contact
+from src.schemas import ContactResponse
+from src.services.response_cache import response_cache
+
+PAGE_SIZES = (10, 100, 1000)
+ROUNDS = 20
+
+
+async def fill(db, count: int) -> User:
+    user = User(name='bench', email='bench@example.com', password='-', confirmed=True)
+    db.add(user)
+    await db.flush()
+    birthday = datetime(1990, 1, 1)
+    await db.execute(insert(Contact), [
+        dict(first_name=f'Name{i}', last_name=f'Last{i}', email=f'contact{i}@example.com', phone='0501234567',
+             birthday=birthday + timedelta(days=i), birthday_md=birthday_key(birthday + timedelta(days=i)),
+             user_id=user.id) for i in range(count)
+    ])
+    await db.commit()
+    return user
+
+
+async def measure(func, rounds: int = ROUNDS) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await func()
+    return (time.perf_counter() - start) / rounds
+
+
+async def main(page_sizes) -> None:
+    engine = create_async_engine('sqlite+aiosqlite://')
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    field = create_response_field(name='Response_get_all', type_=List[ContactResponse])
+
+    async with session_factory() as db:
+        user = await fill(db, max(page_sizes))
+
+    print(f'{"rows":>6} {"model µs/row":>14} {"rows µs/row":>13} {"speedup":>8}')
+    for size in page_sizes:
+        async def model_path():
+            async with session_factory() as db:
+                contacts = await repository_contact.get_all(0, size, user, db)
+                JSONResponse(await serialize_response(field=field, response_content=contacts))
+
+        async def rows_path():
+            async with session_factory() as db:
+                rows = await repository_contact.get_all_rows(0, size, user, db)
+                # no slot: the encoding is measured, not redis
+                await response_cache.put_rows(None, rows)
+
+        await model_path(), await rows_path()
+        before, after = await measure(model_path), await measure(rows_path)
+        print(f'{size:>6} {before / size * 1e6:>14.1f} {after / size * 1e6:>13.1f} {before / after:>7.1f}x')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or PAGE_SIZES))
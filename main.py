@@ -1,13 +1,19 @@
+import asyncio
+
 from fastapi import FastAPI, Depends, HTTPException
-import redis.asyncio as redis
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from src.database.connector import get_db
+from src.database.connector import get_db, engine, pool_stats, redis_db
 from src.routes import contacts, notes, auth, users
 from src.conf.config import settings
 from fastapi.responses import HTMLResponse
-from fastapi_limiter import FastAPILimiter
 from fastapi.middleware.cors import CORSMiddleware
+from src.services.avatars import avatars
+from src.services.birthday_digest import birthday_digest
+from src.services.email import mail_dispatcher
+from src.services.rate_limit import rate_limits
+from src.services.token_cache import token_cache
+from src.services.user_cache import user_cache
 
 app = FastAPI()
 
@@ -15,12 +21,31 @@ app = FastAPI()
 @app.on_event("startup")
 async def startup():
     """
-    Initial redis db and limiter
+    Sync rate limits and follow user cache invalidations on the shared redis pool, start the mail dispatcher,
+    the avatar workers and schedule the birthday digest
 
     """
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
+    app.state.rate_limit_sync = asyncio.create_task(rate_limits.run())
+    app.state.user_cache_listener = asyncio.create_task(user_cache.listen())
+    await mail_dispatcher.start()
+    avatars.start()
+    app.state.birthday_digest = asyncio.create_task(birthday_digest.schedule())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    Stop background jobs and the mail dispatcher, close redis and db connection pools
+
+    """
+    app.state.rate_limit_sync.cancel()
+    app.state.user_cache_listener.cancel()
+    app.state.birthday_digest.cancel()
+    await mail_dispatcher.stop()
+    avatars.shutdown()
+    await redis_db.close()
+    await redis_db.connection_pool.disconnect()
+    await engine.dispose()
 
 
 @app.get("/", response_class=HTMLResponse, description="Main Page")
@@ -35,7 +60,7 @@ async def root():
 
 
 @app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     """
     Health Checker
 
@@ -44,7 +69,7 @@ def healthchecker(db: Session = Depends(get_db)):
     :rtype: dict
     """
     try:
-        result = db.execute(text("SELECT 1")).fetchone()
+        result = (await db.execute(text("SELECT 1"))).fetchone()
         if result is None:
             raise HTTPException(status_code=500, detail="Database is not configured correctly")
         return {"message": "Welcome to FastAPI!"}
@@ -53,6 +78,28 @@ def healthchecker(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error connecting to the database")
 
 
+@app.get("/api/healthchecker/pool")
+async def pool_status():
+    """
+    Connection pool statistics of the current worker
+
+    :return: checked out, idle and overflow connections with checkout wait times
+    :rtype: dict
+    """
+    return pool_stats.snapshot(engine.pool)
+
+
+@app.get("/api/healthchecker/tokens")
+async def token_cache_status():
+    """
+    Verified-token cache statistics of the current worker
+
+    :return: cached tokens with hit and miss counters
+    :rtype: dict
+    """
+    return token_cache.snapshot()
+
+
 app.include_router(contacts.router, prefix='/api')
 app.include_router(contacts.finder, prefix='/api')
 app.include_router(notes.router, prefix='/api')
@@ -65,4 +112,5 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
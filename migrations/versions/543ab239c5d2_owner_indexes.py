@@ -0,0 +1,82 @@
+"""Owner indexes
+
+Bring the schema in line with the models: users table, owner columns,
+birthday key and composite indexes that lead with user_id.
+
+Revision ID: 543ab239c5d2
+Revises: a185efdc1285
+Create Date: 2026-10-18 10:12:40.512337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '543ab239c5d2'
+down_revision = 'a185efdc1285'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=40), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('password', sa.String(length=255), nullable=False),
+    sa.Column('confirmed', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('refresh_token', sa.String(length=255), nullable=True),
+    sa.Column('avatar', sa.String(length=255), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+
+    op.add_column('contacts', sa.Column('birthday_md', sa.Integer(), nullable=True))
+    op.add_column('contacts', sa.Column('user_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('contacts_user_id_fkey', 'contacts', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+    op.add_column('notes', sa.Column('user_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('notes_user_id_fkey', 'notes', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+    op.execute("UPDATE contacts SET birthday_md = EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday) "
+               "WHERE birthday IS NOT NULL")
+
+    # single column indexes ignore the owner, the primary keys are indexed already
+    op.drop_index('ix_contacts_email', table_name='contacts')
+    op.drop_index('ix_contacts_first_name', table_name='contacts')
+    op.drop_index('ix_contacts_id', table_name='contacts')
+    op.drop_index('ix_contacts_last_name', table_name='contacts')
+    op.drop_index('ix_contacts_phone', table_name='contacts')
+    op.drop_index('ix_notes_id', table_name='notes')
+
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_email', 'contacts', ['user_id', 'email'], unique=True)
+    op.create_index('ix_contacts_user_id_first_name', 'contacts', ['user_id', 'first_name'], unique=False)
+    op.create_index('ix_contacts_user_id_last_name', 'contacts', ['user_id', 'last_name'], unique=False)
+    op.create_index('ix_contacts_user_id_birthday_md', 'contacts', ['user_id', 'birthday_md'], unique=False)
+    op.create_index('ix_notes_user_id_contact_id', 'notes', ['user_id', 'contact_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notes_user_id_contact_id', table_name='notes')
+    op.drop_index('ix_contacts_user_id_birthday_md', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_last_name', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_first_name', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_email', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
+
+    op.create_index('ix_notes_id', 'notes', ['id'], unique=False)
+    op.create_index('ix_contacts_phone', 'contacts', ['phone'], unique=False)
+    op.create_index('ix_contacts_last_name', 'contacts', ['last_name'], unique=False)
+    op.create_index('ix_contacts_id', 'contacts', ['id'], unique=False)
+    op.create_index('ix_contacts_first_name', 'contacts', ['first_name'], unique=False)
+    op.create_index('ix_contacts_email', 'contacts', ['email'], unique=True)
+
+    op.drop_constraint('notes_user_id_fkey', 'notes', type_='foreignkey')
+    op.drop_column('notes', 'user_id')
+    op.drop_constraint('contacts_user_id_fkey', 'contacts', type_='foreignkey')
+    op.drop_column('contacts', 'user_id')
+    op.drop_column('contacts', 'birthday_md')
+
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_table('users')
@@ -0,0 +1,36 @@
+"""Digest runs
+
+Progress of the nightly birthday digest, so an interrupted run resumes after the last chunk.
+
+Revision ID: 5e7a0c3d9b14
+Revises: d4b8e2a91f35
+Create Date: 2026-10-18 16:20:09.846501
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7a0c3d9b14'
+down_revision = 'd4b8e2a91f35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('digest_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('run_date', sa.Date(), nullable=False),
+    sa.Column('last_user_id', sa.Integer(), nullable=False),
+    sa.Column('users', sa.Integer(), nullable=False),
+    sa.Column('digests', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('run_date')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('digest_runs')
@@ -0,0 +1,34 @@
+"""Contact search
+
+Generated search_text column with a pg_trgm GIN index for fuzzy search.
+
+Revision ID: 76aac452c8cd
+Revises: 543ab239c5d2
+Create Date: 2026-10-18 11:03:27.184903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '76aac452c8cd'
+down_revision = '543ab239c5d2'
+branch_labels = None
+depends_on = None
+
+SEARCH_TEXT_SQL = ("lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || "
+                   "coalesce(email, '') || ' ' || coalesce(phone, ''))")
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column('contacts', sa.Column('search_text', sa.Text(), sa.Computed(SEARCH_TEXT_SQL, persisted=True),
+                                        nullable=True))
+    op.create_index('ix_contacts_search_text_trgm', 'contacts', ['search_text'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_search_text_trgm', table_name='contacts')
+    op.drop_column('contacts', 'search_text')
@@ -0,0 +1,26 @@
+"""Notes owner id index
+
+Composite (user_id, id) index for keyset pagination of the notes of a user.
+
+Revision ID: 7f3b2d6c8e51
+Revises: 5e7a0c3d9b14
+Create Date: 2026-10-18 19:02:37.215604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f3b2d6c8e51'
+down_revision = '5e7a0c3d9b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_notes_user_id_id', 'notes', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notes_user_id_id', table_name='notes')
@@ -0,0 +1,26 @@
+"""Refresh tokens in redis
+
+Refresh tokens are kept in redis, the users column is no longer used.
+
+Revision ID: 9c1e4f7b2a60
+Revises: 76aac452c8cd
+Create Date: 2026-10-18 14:12:40.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1e4f7b2a60'
+down_revision = '76aac452c8cd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_column('users', 'refresh_token')
+
+
+def downgrade() -> None:
+    op.add_column('users', sa.Column('refresh_token', sa.String(length=255), nullable=True))
@@ -0,0 +1,41 @@
+"""Email outbox
+
+Durable queue of outgoing emails for the mail dispatcher.
+
+Revision ID: d4b8e2a91f35
+Revises: 9c1e4f7b2a60
+Create Date: 2026-10-18 15:02:51.730114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b8e2a91f35'
+down_revision = '9c1e4f7b2a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('email_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('recipient', sa.String(length=120), nullable=False),
+    sa.Column('subject', sa.String(length=255), nullable=False),
+    sa.Column('template', sa.String(length=100), nullable=False),
+    sa.Column('template_body', sa.Text(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_email_outbox_sent_at_next_attempt_at', 'email_outbox', ['sent_at', 'next_attempt_at'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_email_outbox_sent_at_next_attempt_at', table_name='email_outbox')
+    op.drop_table('email_outbox')
@@ -1,8 +1,13 @@
-from pydantic import BaseSettings
+from pydantic import BaseSettings, Field
 
 
 class Settings(BaseSettings):
     database_url: str
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
     secret_key: str
     algorithm: str
     mail_username: str
@@ -10,9 +15,40 @@ class Settings(BaseSettings):
     mail_from: str = 'PythonStudent@meta.ua'
     mail_port: int
     mail_server: str
+    mail_connections: int = 2
+    mail_queue_size: int = 1000
+    mail_batch_size: int = 20
+    mail_max_attempts: int = 5
+    mail_retry_delay: float = 30
+    mail_sweep_interval: float = 60
+    birthday_digest_days: int = 7
+    birthday_digest_chunk_size: int = 500
+    birthday_digest_hour: int = 6
     redis_host: str = 'localhost'
     redis_port: int = 6379
+    redis_max_connections: int = 50
+    redis_pool_timeout: float = 5
+    user_cache_local_size: int = 4096
+    user_cache_local_ttl: int = 60
+    token_cache_size: int = 10000
+    rate_limit_local_share: float = 0.8
+    rate_limit_sync_interval: float = 1.0
+    rate_limit_workers: int = Field(1, env=['rate_limit_workers', 'web_concurrency'])
+    refresh_token_ttl: int = 86400
+    response_cache_ttl: int = 300
+    fast_list_responses: bool = False
+    bcrypt_rounds: int = 12
+    hash_workers: int = 2
+    hash_max_pending: int = 64
     origins: str
+    autocomplete_max_users: int = 1024
+    autocomplete_ttl: int = 300
+    avatar_storage: str = 'filesystem'
+    avatar_dir: str = 'avatars'
+    avatar_url: str = '/api/users/avatars'
+    avatar_max_bytes: int = 5 * 1024 * 1024
+    avatar_size: int = 250
+    avatar_workers: int = 2
     cloudinary_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
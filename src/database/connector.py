@@ -1,24 +1,122 @@
+import time
+
+import redis.asyncio as aioredis
 
 from src.conf.config import settings
 from fastapi import HTTPException, status
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool, AsyncAdaptedQueuePool
+
+
+class PoolStats:
+    """
+    Collects how long requests wait to check out a pooled connection
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """
+        Record one successful checkout
+
+        :param seconds: time spent waiting for the connection
+        :type seconds: float
+        :return: None
+        :rtype: None
+        """
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self, pool: Pool) -> dict:
+        """
+        Current pool occupancy together with the collected wait times
+
+        :param pool: connection pool of the engine
+        :type pool: Pool
+        :return: pool statistics
+        :rtype: dict
+        """
+        size = pool.size() if hasattr(pool, 'size') else None
+        checked_out = pool.checkedout() if hasattr(pool, 'checkedout') else None
+        idle = pool.checkedin() if hasattr(pool, 'checkedin') else None
+        # QueuePool.overflow() is negative until the pool has opened pool_size connections
+        overflow = max(pool.overflow(), 0) if hasattr(pool, 'overflow') else None
+        return {
+            "pool": type(pool).__name__,
+            "size": size,
+            "checked_out": checked_out,
+            "idle": idle,
+            "overflow": overflow,
+            "max_overflow": settings.db_max_overflow,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that reports every checkout wait to pool_stats
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        pool_stats.observe(time.perf_counter() - started)
+        return connection
+
 
 SQLALCHEMY_DATABASE_URL = settings.database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-DBSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=TimedQueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+DBSession = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
+# one asyncio connection pool per worker, shared by the user cache and the rate limiter
+redis_db = aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool(
+    host=settings.redis_host,
+    port=settings.redis_port,
+    db=0,
+    max_connections=settings.redis_max_connections,
+    timeout=settings.redis_pool_timeout,
+))
 
 
 # Dependency
-def get_db():
+async def get_db():
+    """
+    Yield an async session to db, roll back on errors and close it after the request
+
+    :return: current session to db
+    :rtype: AsyncSession
+    """
     db = DBSession()
     try:
         yield db
+    except PoolTimeoutError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database is busy, try again")
     except SQLAlchemyError as err_sql:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err_sql))
     finally:
-        db.close()
-
-
+        await db.close()
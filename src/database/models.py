@@ -1,30 +1,90 @@
-from sqlalchemy import Column, ForeignKey, String, Integer, DateTime, func, Boolean
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import (Column, ForeignKey, String, Integer, Date, DateTime, func, Boolean, Index, Text, Computed, DDL,
+                        event)
+from sqlalchemy.orm import relationship, declarative_base, validates
 
 Base = declarative_base()
 
 
+def birthday_key(birthday):
+    """
+    Month and day of a date packed as MMDD, so birthdays compare without the year
+
+    :param birthday: date of birth
+    :type birthday: date | datetime | None
+    :return: month * 100 + day
+    :rtype: int | None
+    """
+    if birthday is None:
+        return None
+    return birthday.month * 100 + birthday.day
+
+
+SEARCH_TEXT_SQL = ("lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || "
+                   "coalesce(email, '') || ' ' || coalesce(phone, ''))")
+
+
 class Contact(Base):
     __tablename__ = 'contacts'
-    id = Column(Integer, primary_key=True, index=True)
-    first_name = Column(String, index=True)
-    last_name = Column(String, index=True)
-    email = Column(String, unique=True, index=True)
-    phone = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    first_name = Column(String)
+    last_name = Column(String)
+    email = Column(String)
+    phone = Column(String)
     birthday = Column(DateTime)
+    birthday_md = Column(Integer)
+    search_text = Column(Text, Computed(SEARCH_TEXT_SQL, persisted=True))
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref='contacts')
 
+    # every query is scoped by owner, so indexes lead with user_id
+    __table_args__ = (
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_email', 'user_id', 'email', unique=True),
+        Index('ix_contacts_user_id_first_name', 'user_id', 'first_name'),
+        Index('ix_contacts_user_id_last_name', 'user_id', 'last_name'),
+        Index('ix_contacts_user_id_birthday_md', 'user_id', 'birthday_md'),
+        Index('ix_contacts_search_text_trgm', 'search_text', postgresql_using='gin',
+              postgresql_ops={'search_text': 'gin_trgm_ops'}),
+    )
+
+    @validates('birthday')
+    def validate_birthday(self, key, birthday):
+        self.birthday_md = birthday_key(birthday)
+        return birthday
+
+
+# SQLite has no pg_trgm, local runs search through an FTS5 trigram index kept in sync by triggers
+for ddl in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+    "search_text, content='contacts', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, search_text) VALUES (new.id, new.search_text); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+    "INSERT INTO contacts_fts(rowid, search_text) VALUES (new.id, new.search_text); END",
+):
+    event.listen(Contact.__table__, 'after_create', DDL(ddl).execute_if(dialect='sqlite'))
+event.listen(Contact.__table__, 'before_create',
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql'))
+event.listen(Contact.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS contacts_fts").execute_if(dialect='sqlite'))
+
 
 class Note(Base):
     __tablename__ = 'notes'
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     contact_id = Column(Integer, ForeignKey('contacts.id'), nullable=False)
     text = Column(String)
     contact = relationship("Contact", backref='notes')
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref='notes')
 
+    __table_args__ = (
+        Index('ix_notes_user_id_id', 'user_id', 'id'),
+        Index('ix_notes_user_id_contact_id', 'user_id', 'contact_id'),
+    )
+
 
 class User(Base):
     __tablename__ = 'users'
@@ -34,8 +94,33 @@ class User(Base):
     password = Column(String(255), nullable=False)
     confirmed = Column(Boolean, default=False)
     created_at = Column('created_at', DateTime, default=func.now())
-    refresh_token = Column(String(255), nullable=True)
     avatar = Column(String(255), nullable=True)
 
 
+class OutboxEmail(Base):
+    __tablename__ = 'email_outbox'
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String(120), nullable=False)
+    subject = Column(String(255), nullable=False)
+    template = Column(String(100), nullable=False)
+    template_body = Column(Text, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column('created_at', DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('ix_email_outbox_sent_at_next_attempt_at', 'sent_at', 'next_attempt_at'),
+    )
 
+
+class DigestRun(Base):
+    __tablename__ = 'digest_runs'
+    id = Column(Integer, primary_key=True)
+    run_date = Column(Date, nullable=False, unique=True)
+    last_user_id = Column(Integer, nullable=False, default=0)
+    users = Column(Integer, nullable=False, default=0)
+    digests = Column(Integer, nullable=False, default=0)
+    started_at = Column('started_at', DateTime, default=func.now())
+    finished_at = Column(DateTime, nullable=True)
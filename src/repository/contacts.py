@@ -1,11 +1,20 @@
-from src.database.models import Contact, User
-from src.schemas import ContactModel
-from sqlalchemy.orm import Session
-from datetime import date, datetime
-from sqlalchemy import and_
+from src.database.models import Contact, User, birthday_key
+from typing import List
+from src.schemas import ContactModel, ContactBulkSelect, ContactResponse
+from src.services.autocomplete import autocomplete
+from src.services.response_cache import response_cache
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, timedelta
+from sqlalchemy import (and_, or_, case, select, update as sql_update, delete as sql_delete, func, literal,
+                        literal_column, table, column)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
+# columns of the fast list responses, in the order of the response model
+CONTACT_ROW = [getattr(Contact, field) for field in ContactResponse.__fields__]
 
-async def create(body: ContactModel, user: User, db: Session):
+
+async def create(body: ContactModel, user: User, db: AsyncSession):
     """
     Create a new contact
 
@@ -14,36 +23,135 @@ async def create(body: ContactModel, user: User, db: Session):
     :param user: current user - contact owner 
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
     contact = Contact(**body.dict(), user_id=user.id)
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await db.commit()
+    await db.refresh(contact)
+    autocomplete.saved(contact)
+    await response_cache.bump(user.id)
     return contact
 
 
-async def get_all(skip: int, limit: int, user: User, db: Session):
+async def create_many(bodies: List[ContactModel], user: User, db: AsyncSession) -> int:
+    """
+    Insert a batch of contacts with one INSERT ... ON CONFLICT DO NOTHING, skipping emails the user already has.
+    The unique (user_id, email) index decides, so a concurrent import or create cannot fail the batch
+
+    :param bodies: validated contacts to insert
+    :type bodies: List[ContactModel]
+    :param user: current user - contact owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: number of inserted contacts
+    :rtype: int
+    """
+    by_email = {}
+    for body in bodies:
+        by_email.setdefault(body.email, body)
+    if not by_email:
+        return 0
+    dialect_insert = pg_insert if db.get_bind().dialect.name == 'postgresql' else sqlite_insert
+    result = await db.execute(
+        dialect_insert(Contact).on_conflict_do_nothing(index_elements=[Contact.user_id, Contact.email])
+        .returning(Contact.id),
+        [dict(body.dict(), user_id=user.id, birthday_md=birthday_key(body.birthday)) for body in by_email.values()]
+    )
+    inserted = len(result.scalars().all())
+    await db.commit()
+    if inserted:
+        autocomplete.invalidate(user.id)
+        await response_cache.bump(user.id)
+    return inserted
+
+
+async def get_all(skip: int, limit: int, user: User, db: AsyncSession, after: int | None = None):
     """
-    get part of contact from current user
+    get part of contact from current user ordered by id
 
-    :param skip: number of contacts to skip
+    :param skip: number of contacts to skip, ignored when after is set
     :type skip: int
     :param limit: number of contacts to return
     :type limit: int
     :param user: current user - contact owner 
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
+    :param after: return only contacts with id greater than this one (keyset pagination)
+    :type after: int | None
     :return: part of contact from current user
     :rtype: List
     """
-    return db.query(Contact).filter(Contact.user_id == user.id).offset(skip).limit(limit).all()
+    contacts = await db.scalars(_page(select(Contact), skip, limit, user, after))
+    return contacts.all()
+
+
+async def get_all_rows(skip: int, limit: int, user: User, db: AsyncSession, after: int | None = None):
+    """
+    the same page as get_all as plain rows with the ContactResponse fields, without building orm objects
+
+    :param skip: number of contacts to skip, ignored when after is set
+    :type skip: int
+    :param limit: number of contacts to return
+    :type limit: int
+    :param user: current user - contact owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :param after: return only contacts with id greater than this one (keyset pagination)
+    :type after: int | None
+    :return: rows ready for response_cache.put_rows
+    :rtype: List
+    """
+    rows = await db.execute(_page(select(*CONTACT_ROW), skip, limit, user, after))
+    return rows.all()
 
 
-async def get_one(contact_id, user: User, db: Session):
+def _page(query, skip: int, limit: int, user: User, after: int | None):
+    """
+    limit a contacts query to one page of the owner's contacts ordered by id
+
+    :param query: select of contacts or their columns
+    :type query: Select
+    :param skip: number of contacts to skip, ignored when after is set
+    :type skip: int
+    :param limit: number of contacts to return
+    :type limit: int
+    :param user: current user - contact owner
+    :type user: User
+    :param after: id of the last contact of the previous page
+    :type after: int | None
+    :return: page query
+    :rtype: Select
+    """
+    query = query.filter(Contact.user_id == user.id).order_by(Contact.id).limit(limit)
+    if after is not None:
+        return query.filter(Contact.id > after)
+    return query.offset(skip)
+
+
+async def stream_all(user: User, db: AsyncSession):
+    """
+    all contacts of current user as a server-side cursor, fetched yield_per rows at a time
+
+    :param user: current user - contact owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: rows with id, first_name, last_name, email, phone, birthday
+    :rtype: AsyncResult
+    """
+    return await db.stream(
+        select(Contact.id, Contact.first_name, Contact.last_name, Contact.email, Contact.phone, Contact.birthday)
+        .filter(Contact.user_id == user.id).order_by(Contact.id).execution_options(yield_per=1000)
+    )
+
+
+async def get_one(contact_id, user: User, db: AsyncSession):
     """
     get contact by db id
 
@@ -52,15 +160,15 @@ async def get_one(contact_id, user: User, db: Session):
     :param user: current user - contact owner 
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
-    contact = db.query(Contact).filter(and_(Contact.user_id == user.id, Contact.id == contact_id)).first()
+    contact = await db.scalar(select(Contact).filter(and_(Contact.user_id == user.id, Contact.id == contact_id)))
     return contact
 
 
-async def update(contact_id, body: ContactModel, user: User, db: Session):
+async def update(contact_id, body: ContactModel, user: User, db: AsyncSession):
     """
     Update contact field, find by db id
 
@@ -71,18 +179,20 @@ async def update(contact_id, body: ContactModel, user: User, db: Session):
     :param user: current user - contact owner 
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
     contact = await get_one(contact_id, user, db)
     if contact:
         contact.first_name = body.first_name
-        db.commit()
+        await db.commit()
+        autocomplete.saved(contact)
+        await response_cache.bump(user.id)
     return contact
 
 
-async def delete(contact_id, user: User, db: Session):
+async def delete(contact_id, user: User, db: AsyncSession):
     """
     delete contact find contact by db id
 
@@ -91,18 +201,94 @@ async def delete(contact_id, user: User, db: Session):
     :param user: current user - contact owner
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
     contact = await get_one(contact_id, user, db)
     if contact:
-        db.delete(contact)
-        db.commit()
+        await db.delete(contact)
+        await db.commit()
+        autocomplete.removed(contact)
+        await response_cache.bump(user.id)
     return contact
 
 
-async def find_by_name(contact_name, user: User, db: Session):
+def _selection(selection: ContactBulkSelect, user: User):
+    """
+    where clause for the contacts picked by ids and/or filter, always limited to the owner
+
+    :param selection: ids and/or exact match filter
+    :type selection: ContactBulkSelect
+    :param user: current user - contact owner
+    :type user: User
+    :return: where clause
+    :rtype: ColumnElement
+    """
+    conditions = [Contact.user_id == user.id]
+    if selection.ids:
+        conditions.append(Contact.id.in_(selection.ids))
+    if selection.filter:
+        for field, value in selection.filter.dict(exclude_none=True).items():
+            conditions.append(getattr(Contact, field) == value)
+    return and_(*conditions)
+
+
+async def update_many(selection: ContactBulkSelect, values: dict, user: User, db: AsyncSession) -> List[int]:
+    """
+    Update many contacts with one UPDATE ... RETURNING statement
+
+    :param selection: ids and/or filter of contacts to update
+    :type selection: ContactBulkSelect
+    :param values: new values of the fields
+    :type values: dict
+    :param user: current user - contact owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: ids of updated contacts
+    :rtype: List[int]
+    """
+    if 'birthday' in values:
+        values = dict(values, birthday_md=birthday_key(values['birthday']))
+    result = await db.execute(
+        sql_update(Contact).where(_selection(selection, user)).values(**values).returning(Contact.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = result.scalars().all()
+    await db.commit()
+    autocomplete.invalidate(user.id)
+    if ids:
+        await response_cache.bump(user.id)
+    return ids
+
+
+async def delete_many(selection: ContactBulkSelect, user: User, db: AsyncSession) -> List[int]:
+    """
+    Delete many contacts with one DELETE ... RETURNING statement
+
+    :param selection: ids and/or filter of contacts to delete
+    :type selection: ContactBulkSelect
+    :param user: current user - contact owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: ids of deleted contacts
+    :rtype: List[int]
+    """
+    result = await db.execute(
+        sql_delete(Contact).where(_selection(selection, user)).returning(Contact.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = result.scalars().all()
+    await db.commit()
+    autocomplete.invalidate(user.id)
+    if ids:
+        await response_cache.bump(user.id)
+    return ids
+
+
+async def find_by_name(contact_name, user: User, db: AsyncSession):
     """
     get contact by first name in db
 
@@ -111,15 +297,17 @@ async def find_by_name(contact_name, user: User, db: Session):
     :param user: current user - contact owner
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
-    contact = db.query(Contact).filter(and_(Contact.user_id == user.id, Contact.first_name == contact_name)).first()
+    contact = await db.scalar(
+        select(Contact).filter(and_(Contact.user_id == user.id, Contact.first_name == contact_name))
+    )
     return contact
 
 
-async def find_by_lastname(lastname, user: User, db: Session):
+async def find_by_lastname(lastname, user: User, db: AsyncSession):
     """
     get contact by last name in db
 
@@ -128,15 +316,17 @@ async def find_by_lastname(lastname, user: User, db: Session):
     :param user: current user - contact owner
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
-    contact = db.query(Contact).filter(and_(Contact.user_id == user.id, Contact.last_name == lastname)).first()
+    contact = await db.scalar(
+        select(Contact).filter(and_(Contact.user_id == user.id, Contact.last_name == lastname))
+    )
     return contact
 
 
-async def find_by_email(email, user: User, db: Session):
+async def find_by_email(email, user: User, db: AsyncSession):
     """
     get contact by email in db
 
@@ -145,33 +335,161 @@ async def find_by_email(email, user: User, db: Session):
     :param user: current user - contact owner
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
-    contact = db.query(Contact).filter(and_(Contact.user_id == user.id, Contact.email == email)).first()
+    contact = await db.scalar(select(Contact).filter(and_(Contact.user_id == user.id, Contact.email == email)))
     return contact
 
 
-async def find_birthday7day(user: User, db: Session):
+async def autocomplete_names(prefix: str, limit: int, user: User, db: AsyncSession):
+    """
+    contacts whose first or last name starts with prefix, served from the in-process prefix index
+
+    :param prefix: beginning of the name
+    :type prefix: str
+    :param limit: max number of suggestions
+    :type limit: int
+    :param user: current user - contact owner
+    :type user: User
+    :param db: current session to db, used only to build the index
+    :type db: AsyncSession
+    :return: suggestions with id, first_name and last_name
+    :rtype: List
+    """
+    index = await autocomplete.get(user, db)
+    return index.search(prefix, limit)
+
+
+contacts_fts = table('contacts_fts', column('rowid'))
+
+
+def _fts_query(q: str) -> str | None:
+    """
+    FTS5 query that matches any trigram of the search words, so a typo still shares most of them
+
+    :param q: search string
+    :type q: str
+    :return: MATCH expression or None for words shorter than a trigram
+    :rtype: str | None
+    """
+    trigrams = {word[i:i + 3] for word in q.split() for i in range(len(word) - 2)}
+    if not trigrams:
+        return None
+    return ' OR '.join('"' + trigram.replace('"', '""') + '"' for trigram in sorted(trigrams))
+
+
+async def search(q: str, skip: int, limit: int, user: User, db: AsyncSession):
+    """
+    fuzzy search by name, email and phone, best match first.
+    Postgres ranks with pg_trgm word similarity, SQLite with bm25 over the FTS5 trigram index
+
+    :param q: search string, may be partial or misspelled
+    :type q: str
+    :param skip: number of matches to skip
+    :type skip: int
+    :param limit: number of matches to return
+    :type limit: int
+    :param user: current user - contact owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: matching contacts
+    :rtype: List
+    """
+    q = q.strip().lower()
+    query = select(Contact).filter(Contact.user_id == user.id)
+    dialect = db.get_bind().dialect.name
+    match = _fts_query(q)
+    if match is not None and dialect == 'postgresql':
+        query = query.filter(literal(q).op('<%')(Contact.search_text)) \
+            .order_by(func.word_similarity(q, Contact.search_text).desc(), Contact.id)
+    elif match is not None and dialect == 'sqlite':
+        fts = literal_column('contacts_fts')
+        query = query.join(contacts_fts, contacts_fts.c.rowid == Contact.id).filter(fts.op('MATCH')(match)) \
+            .order_by(func.bm25(fts), Contact.id)
+    else:
+        # too short for trigrams or no trigram support: plain substring scan of the owner's rows
+        query = query.filter(Contact.search_text.contains(q, autoescape=True)).order_by(Contact.id)
+    contacts = await db.scalars(query.offset(skip).limit(limit))
+    return contacts.all()
+
+
+def _birthday_window(days: int, today: date):
+    """
+    Filter and ordering for birthdays in the next days on the indexed MMDD key, wrapping over new year
+
+    :param days: size of the window, 0 means only today
+    :type days: int
+    :param today: first day of the window
+    :type today: date
+    :return: filters, contacts without a birthday never match, and the nearest first ordering
+    :rtype: tuple
+    """
+    start = birthday_key(today)
+    end = birthday_key(today + timedelta(days=days))
+    conditions = [Contact.birthday.isnot(None)]
+    if days < 365:
+        if start <= end:
+            conditions.append(Contact.birthday_md.between(start, end))
+        else:
+            conditions.append(or_(Contact.birthday_md >= start, Contact.birthday_md <= end))
+    next_year = case((Contact.birthday_md < start, 1), else_=0)
+    return conditions, (next_year, Contact.birthday_md, Contact.id)
+
+
+async def find_upcoming_birthdays(days: int, user: User, db: AsyncSession):
+    """
+    contacts with birthday in the next days, nearest first.
+    The window is matched in db on the indexed MMDD key, wrapping over new year
+
+    :param days: size of the window, 0 means only today
+    :type days: int
+    :param user: current user - contact owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: contacts with birthday in the window
+    :rtype: List
+    """
+    conditions, order = _birthday_window(days, date.today())
+    query = select(Contact).filter(Contact.user_id == user.id, *conditions)
+    contacts = await db.scalars(query.order_by(*order))
+    return contacts.all()
+
+
+async def upcoming_birthdays_of_users(user_ids: List[int], days: int, today: date, db: AsyncSession):
+    """
+    birthdays in the next days for a chunk of users in one query on the (user_id, MMDD) index
+
+    :param user_ids: contact owner ids
+    :type user_ids: List[int]
+    :param days: size of the window, 0 means only today
+    :type days: int
+    :param today: first day of the window
+    :type today: date
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: rows of user_id, first_name, last_name, birthday grouped by user, nearest first
+    :rtype: List
+    """
+    conditions, order = _birthday_window(days, today)
+    query = select(Contact.user_id, Contact.first_name, Contact.last_name, Contact.birthday) \
+        .filter(Contact.user_id.in_(user_ids), *conditions)
+    rows = await db.execute(query.order_by(Contact.user_id, *order))
+    return rows.all()
+
+
+async def find_birthday7day(user: User, db: AsyncSession):
     """
     contact with birthday next 7 days
 
     :param user: current user - contact owner 
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: contact with birthday next 7 days 
     :rtype: List
     """
-    contacts = []
-    db_contacts = await get_all(skip=0, limit=100, user=user, db=db)
-    today = date.today()
-    for db_contact in db_contacts:
-        birthday = db_contact.birthday
-        shift = (datetime(today.year, birthday.month, birthday.day).date() - today).days
-        if shift < 0:
-            shift = (datetime(today.year + 1, birthday.month, birthday.day).date() - today).days
-        if shift <= 7:
-            contacts.append(db_contact)
-    return contacts
+    return await find_upcoming_birthdays(7, user, db)
@@ -0,0 +1,80 @@
+from datetime import date, datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import DigestRun
+
+
+async def get_run(run_date: date, db: AsyncSession) -> DigestRun:
+    """
+    Progress of the digest run of a day, the run is started on first use
+
+    :param run_date: day of the run
+    :type run_date: date
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: run with the last processed user
+    :rtype: DigestRun
+    """
+    run = await db.scalar(select(DigestRun).filter(DigestRun.run_date == run_date)
+                          .execution_options(populate_existing=True))
+    if run is not None:
+        return run
+    db.add(DigestRun(run_date=run_date, last_user_id=0, users=0, digests=0))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # another worker started the same run
+        await db.rollback()
+    return await db.scalar(select(DigestRun).filter(DigestRun.run_date == run_date))
+
+
+async def advance(run_date: date, last_user_id: int, next_user_id: int, users: int, digests: int,
+                  db: AsyncSession) -> bool:
+    """
+    Move the run past a chunk of users in the transaction of the caller, who commits it with the digests.
+    Only succeeds if nobody processed the chunk meanwhile
+
+    :param run_date: day of the run
+    :type run_date: date
+    :param last_user_id: last user id the chunk was read after
+    :type last_user_id: int
+    :param next_user_id: last user id of the chunk
+    :type next_user_id: int
+    :param users: users in the chunk
+    :type users: int
+    :param digests: digests made for the chunk
+    :type digests: int
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: False if the chunk was already processed by another worker
+    :rtype: bool
+    """
+    result = await db.execute(
+        update(DigestRun)
+        .where(DigestRun.run_date == run_date, DigestRun.last_user_id == last_user_id)
+        .values(last_user_id=next_user_id, users=DigestRun.users + users, digests=DigestRun.digests + digests)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def finish(run_date: date, db: AsyncSession) -> None:
+    """
+    Mark the run of a day as done
+
+    :param run_date: day of the run
+    :type run_date: date
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: None
+    :rtype: None
+    """
+    await db.execute(
+        update(DigestRun).where(DigestRun.run_date == run_date, DigestRun.finished_at.is_(None))
+        .values(finished_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
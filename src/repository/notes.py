@@ -1,11 +1,16 @@
-from src.database.models import Note, User
-from src.schemas import NoteModel
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from src.database.models import Contact, Note, User
+from src.schemas import NoteModel, NoteResponse
+from src.services.response_cache import response_cache
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, select
+from sqlalchemy.orm import selectinload
 from typing import List
 
+# columns of the fast list responses, in the order of the response model
+NOTE_ROW = [getattr(Note, field) for field in NoteResponse.__fields__]
 
-async def create(body: NoteModel, user: User, db: Session):
+
+async def create(body: NoteModel, user: User, db: AsyncSession):
     """
     Create a new note
 
@@ -14,32 +19,120 @@ async def create(body: NoteModel, user: User, db: Session):
     :param user: current user - contact owner
     :type user: User
     :param db: current session to db
-    :type db: Session
-    :return: Note | None
+    :type db: AsyncSession
+    :return: Note | None if the contact is not owned by the user
     :rtype: Note | None
     """
+    if not await _owns_contact(body.contact_id, user, db):
+        return None
     note = Note(**body.dict(), user_id=user.id)
     db.add(note)
-    db.commit()
-    db.refresh(note)
+    await db.commit()
+    await db.refresh(note)
+    await response_cache.bump(user.id)
     return note
 
 
-async def get_all(user: User, db: Session) -> List[Note]:
+async def get_all(limit: int, user: User, db: AsyncSession, after: int | None = None,
+                  with_contact: bool = False) -> List[Note]:
     """
-    get notes from current user
+    get a page of notes from current user ordered by id
 
+    :param limit: number of notes to return
+    :type limit: int
     :param user: current user - contact owner
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
+    :param after: return only notes with id greater than this one (keyset pagination)
+    :type after: int | None
+    :param with_contact: load the contacts of the page with one more query instead of a lazy load per note,
+        only contacts of the user are loaded, others stay None
+    :type with_contact: bool
     :return: Note
     :rtype: List
     """
-    return db.query(Note).filter(Note.user_id == user.id).all()
+    query = _page(select(Note), limit, user, after)
+    if with_contact:
+        query = query.options(selectinload(Note.contact.and_(Contact.user_id == user.id)))
+    notes = await db.scalars(query)
+    return notes.all()
+
+
+async def get_all_rows(limit: int, user: User, db: AsyncSession, after: int | None = None):
+    """
+    the same page as get_all as plain rows with the NoteResponse fields, without building orm objects
+
+    :param limit: number of notes to return
+    :type limit: int
+    :param user: current user - note owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :param after: return only notes with id greater than this one (keyset pagination)
+    :type after: int | None
+    :return: rows ready for response_cache.put_rows
+    :rtype: List
+    """
+    rows = await db.execute(_page(select(*NOTE_ROW), limit, user, after))
+    return rows.all()
 
 
-async def get_one(note_id, user: User, db: Session):
+async def _owns_contact(contact_id: int, user: User, db: AsyncSession) -> bool:
+    """
+    check that a note may point at the contact
+
+    :param contact_id: contact id from the request
+    :type contact_id: int
+    :param user: current user - note owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: True if the contact belongs to the user
+    :rtype: bool
+    """
+    return await db.scalar(select(Contact.id).filter(Contact.id == contact_id, Contact.user_id == user.id)) is not None
+
+
+def _page(query, limit: int, user: User, after: int | None):
+    """
+    limit a notes query to one page of the owner's notes ordered by id, on the (user_id, id) index
+
+    :param query: select of notes or their columns
+    :type query: Select
+    :param limit: number of notes to return
+    :type limit: int
+    :param user: current user - note owner
+    :type user: User
+    :param after: id of the last note of the previous page
+    :type after: int | None
+    :return: page query
+    :rtype: Select
+    """
+    query = query.filter(Note.user_id == user.id).order_by(Note.id).limit(limit)
+    if after is not None:
+        query = query.filter(Note.id > after)
+    return query
+
+
+async def stream_all(user: User, db: AsyncSession):
+    """
+    all notes of current user as a server-side cursor, fetched yield_per rows at a time
+
+    :param user: current user - note owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: rows with id, contact_id, text
+    :rtype: AsyncResult
+    """
+    return await db.stream(
+        select(Note.id, Note.contact_id, Note.text)
+        .filter(Note.user_id == user.id).order_by(Note.id).execution_options(yield_per=1000)
+    )
+
+
+async def get_one(note_id, user: User, db: AsyncSession):
     """
     get note by db id
 
@@ -48,15 +141,15 @@ async def get_one(note_id, user: User, db: Session):
     :param user: current user - contact owner
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Note | None
     :rtype: Note | None
     """
-    note = db.query(Note).filter(and_(Note.user_id == user.id, id == note_id)).first()
+    note = await db.scalar(select(Note).filter(and_(Note.user_id == user.id, Note.id == note_id)))
     return note
 
 
-async def update(note_id, body: NoteModel, user: User, db: Session):
+async def update(note_id, body: NoteModel, user: User, db: AsyncSession):
     """
     Update note, find by db id
 
@@ -67,18 +160,23 @@ async def update(note_id, body: NoteModel, user: User, db: Session):
     :param user: current user - contact owner
     :type user: User
     :param db: current session to db
-    :type db: Session
-    :return: Note | None
+    :type db: AsyncSession
+    :return: Note | None, also None if a new contact is not owned by the user
     :rtype: Note | None
     """
     note = await get_one(note_id, user, db)
     if note:
+        if 'contact_id' in body.__fields_set__ and body.contact_id != note.contact_id:
+            if not await _owns_contact(body.contact_id, user, db):
+                return None
+            note.contact_id = body.contact_id
         note.text = body.text
-        db.commit()
+        await db.commit()
+        await response_cache.bump(user.id)
     return note
 
 
-async def delete(note_id, user: User, db: Session):
+async def delete(note_id, user: User, db: AsyncSession):
     """
     delete note find note by db id
 
@@ -87,13 +185,14 @@ async def delete(note_id, user: User, db: Session):
     :param user: current user - contact owner
     :type user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Note | None
     :rtype: Note | None
     """
     note = await get_one(note_id, user, db)
     if note:
-        db.delete(note)
-        db.commit()
+        await db.delete(note)
+        await db.commit()
+        await response_cache.bump(user.id)
     return note
 
@@ -0,0 +1,144 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import OutboxEmail
+
+
+async def enqueue(recipient: str, subject: str, template: str, template_body: dict, db: AsyncSession) -> OutboxEmail:
+    """
+    Store an email to be sent by the mail dispatcher
+
+    :param recipient: email address
+    :type recipient: str
+    :param subject: subject of the email
+    :type subject: str
+    :param template: template file name
+    :type template: str
+    :param template_body: template variables
+    :type template_body: dict
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: stored email
+    :rtype: OutboxEmail
+    """
+    email = OutboxEmail(recipient=recipient, subject=subject, template=template,
+                        template_body=json.dumps(template_body), next_attempt_at=datetime.utcnow())
+    db.add(email)
+    await db.commit()
+    return email
+
+
+async def enqueue_many(emails: list[dict], db: AsyncSession) -> list[int]:
+    """
+    Store emails in the transaction of the caller, who commits them
+
+    :param emails: recipient, subject, template and template_body of every email
+    :type emails: list[dict]
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: ids of stored emails
+    :rtype: list[int]
+    """
+    if not emails:
+        return []
+    now = datetime.utcnow()
+    result = await db.scalars(
+        insert(OutboxEmail).returning(OutboxEmail.id),
+        [{**email, "template_body": json.dumps(email["template_body"]), "attempts": 0, "next_attempt_at": now,
+          "created_at": now} for email in emails]
+    )
+    return result.all()
+
+
+async def due_ids(limit: int, max_attempts: int, db: AsyncSession) -> list[int]:
+    """
+    Unsent emails whose next attempt is due, oldest first
+
+    :param limit: max number of emails
+    :type limit: int
+    :param max_attempts: emails that failed this many times are not retried
+    :type max_attempts: int
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: email ids
+    :rtype: list[int]
+    """
+    result = await db.scalars(
+        select(OutboxEmail.id)
+        .filter(OutboxEmail.sent_at.is_(None), OutboxEmail.next_attempt_at <= datetime.utcnow(),
+                OutboxEmail.attempts < max_attempts)
+        .order_by(OutboxEmail.next_attempt_at)
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def claim(ids: list[int], lease: float, db: AsyncSession) -> list[OutboxEmail]:
+    """
+    Take due emails for sending, other workers skip them until the lease runs out
+
+    :param ids: email ids
+    :type ids: list[int]
+    :param lease: seconds before an unfinished email is due again
+    :type lease: float
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: claimed emails, already sent or claimed ones are left out
+    :rtype: list[OutboxEmail]
+    """
+    now = datetime.utcnow()
+    result = await db.scalars(
+        update(OutboxEmail)
+        .where(OutboxEmail.id.in_(ids), OutboxEmail.sent_at.is_(None), OutboxEmail.next_attempt_at <= now)
+        .values(next_attempt_at=now + timedelta(seconds=lease))
+        .returning(OutboxEmail)
+        .execution_options(synchronize_session=False)
+    )
+    emails = result.all()
+    await db.commit()
+    return emails
+
+
+async def mark_sent(ids: list[int], db: AsyncSession) -> None:
+    """
+    Record delivered emails
+
+    :param ids: email ids
+    :type ids: list[int]
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: None
+    :rtype: None
+    """
+    await db.execute(
+        update(OutboxEmail).where(OutboxEmail.id.in_(ids)).values(sent_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def mark_failed(email_id: int, error: str, retry_in: float, db: AsyncSession) -> None:
+    """
+    Record a failed attempt and when to try again
+
+    :param email_id: email id
+    :type email_id: int
+    :param error: error of the attempt
+    :type error: str
+    :param retry_in: seconds before the next attempt
+    :type retry_in: float
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: None
+    :rtype: None
+    """
+    await db.execute(
+        update(OutboxEmail).where(OutboxEmail.id == email_id)
+        .values(attempts=OutboxEmail.attempts + 1, last_error=error,
+                next_attempt_at=datetime.utcnow() + timedelta(seconds=retry_in))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
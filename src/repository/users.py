@@ -1,74 +1,77 @@
 from src.schemas import UserModel
 from src.database.models import User
-from sqlalchemy.orm import Session
+from src.services.user_cache import user_cache
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
-async def get_user_by_email(email: str, db: Session) -> User:
+async def get_user_by_email(email: str, db: AsyncSession) -> User:
     """
     Get user by email
 
     :param email: user's email in db
     :type email: str
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: User | None
     :rtype: User | None
     """
-    return db.query(User).filter(User.email == email).first()
+    return await db.scalar(select(User).filter(User.email == email))
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession) -> User:
     """
     Create a new user
 
     :param body: all field for new user
     :type body: UserModel
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: User | None
     :rtype: User | None
     """
     new_user = User(**body.dict())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     Set confirmed field for user in db
 
     :param email: user's email in db
     :type email: str
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: None if user is not confirmed
     :rtype: None
     """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+async def update_password(user: User, password_hash: str, db: AsyncSession) -> None:
     """
-    Update token for user
+    Replace the password hash, used to upgrade hashes made with another cost factor
 
-    :param user: all field for new user
-    :type user: UserModel
-    :param token: old token
-    :type token: str
+    :param user: user from db
+    :type user: User
+    :param password_hash: new hash of the same password
+    :type password_hash: str
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: None
     :rtype: None
     """
-    user.refresh_token = token
-    db.commit()
+    user.password = password_hash
+    await db.commit()
 
 
-async def update_avatar(email, url: str, db: Session) -> User:
+async def update_avatar(email, url: str, db: AsyncSession) -> User:
     """
     Update user's avatar
 
@@ -77,11 +80,34 @@ async def update_avatar(email, url: str, db: Session) -> User:
     :param url: url for avatar image
     :type url: str
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: User | None
     :rtype: User | None
     """
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
     return user
+
+
+async def confirmed_after(user_id: int, limit: int, db: AsyncSession):
+    """
+    Next chunk of confirmed users by id, for jobs that walk all users
+
+    :param user_id: last user id of the previous chunk
+    :type user_id: int
+    :param limit: size of the chunk
+    :type limit: int
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: rows of id, name, email
+    :rtype: List
+    """
+    rows = await db.execute(
+        select(User.id, User.name, User.email)
+        .filter(User.id > user_id, User.confirmed.is_(True))
+        .order_by(User.id)
+        .limit(limit)
+    )
+    return rows.all()
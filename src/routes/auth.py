@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, status, HTTPException, Security, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, status, HTTPException, Security, Request
+from src.database.models import User
 from src.repository import users as repository_user
 from src.schemas import UserResponse, UserModel, TokenModel, RequestEmail
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.connector import get_db
 from fastapi.security import HTTPBearer, OAuth2PasswordRequestForm, HTTPAuthorizationCredentials
 from src.services.auth import auth_service
+from src.services.refresh_tokens import refresh_tokens
 from src.services.email import send_email
 
 
@@ -13,39 +15,37 @@ security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, request: Request, db: AsyncSession = Depends(get_db)):
     """
     router to create new user
     
     :param body: incoming user model
     :type body: UserModel
-    :param background_tasks: to perform the task of sending a email
-    :type background_tasks: BackgroundTasks
     :param request: incoming
     :type request: Request
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: new user
     :rtype: dict
     """
     old_user = await repository_user.get_user_by_email(body.email, db)
     if old_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_hash(body.password)
+    body.password = await auth_service.get_hash(body.password)
     new_user = await repository_user.create_user(body, db)
-    background_tasks.add_task(send_email, body.email, new_user.name, request.base_url)
+    await send_email(body.email, new_user.name, request.base_url, db)
     return {"user": new_user, "detail": "User successfully created"}
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     router to login user and create/refresh token
     
     :param body: password form data
     :type body: OAuth2PasswordRequestForm
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: token JWT
     :rtype: dict
     """
@@ -54,49 +54,59 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Account not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    verified, new_hash = await auth_service.verify_password(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    if new_hash:
+        await repository_user.update_password(user, new_hash, db)
     # Generate JWT
     access_token = await auth_service.create_access_token(data={"sub": user.email})
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_user.update_token(user, refresh_token, db)
+    await refresh_tokens.issue(user.email, refresh_token)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security)):
     """
-    router to refresh token
+    router to refresh token, rotated in redis without touching db
     
     :param credentials: data with old token
     :type credentials: HTTPAuthorizationCredentials
-    :param db: current session to db
-    :type db: Session
     :return: token JWT
     :rtype: dict
     """
     token = credentials.credentials
     email = await auth_service.decode_refresh_token(token)
-    user = await repository_user.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_user.update_token(user, None, db)
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-
     access_token = await auth_service.create_access_token(data={"sub": email})
     refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_user.update_token(user, refresh_token, db)
+    if not await refresh_tokens.rotate(email, token, refresh_token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
+@router.post('/logout', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(cur_user: User = Depends(auth_service.get_current_user)):
+    """
+    router to logout user, the refresh token stops working
+
+    :param cur_user: current user
+    :type cur_user: User
+    :return: None
+    :rtype: None
+    """
+    await refresh_tokens.revoke(cur_user.email)
+
+
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     router to confirm email
     
     :param token: user token
     :type token: str
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: token JWT
     :rtype: dict
     """
@@ -111,26 +121,23 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)):
     """
     router to send email for confirmation
     
     :param body: form to send email
     :type body: RequestEmail
-    :param background_tasks: to perform the task of sending a email
-    :type background_tasks: BackgroundTasks
     :param request: incoming request
     :type request: Request
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: new user
     :rtype: dict
     """
     user = await repository_user.get_user_by_email(body.email, db)
-    if user.confirmed:
+    if user and user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+        await send_email(user.email, user.name, request.base_url, db)
     return {"message": "Check your email for confirmation."}
 
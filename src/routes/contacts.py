@@ -1,13 +1,19 @@
-from typing import List
-from fastapi import APIRouter, Depends, status, HTTPException, Path
-from fastapi_limiter.depends import RateLimiter
+from typing import List, Literal
+from fastapi import APIRouter, Depends, status, HTTPException, Path, Query, Request, UploadFile, File
+from fastapi.responses import StreamingResponse
 
+from src.conf.config import settings
 from src.database.models import User
 from src.repository import contacts as repository_contact
-from src.schemas import ContactResponse, ContactModel
-from sqlalchemy.orm import Session
+from src.schemas import ContactResponse, ContactModel, ContactSuggestion, ContactImportResponse, ContactBulkSelect, \
+    ContactBulkUpdate, ContactBulkResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.connector import get_db
 from src.services.auth import auth_service as auth
+from src.services.cursor import encode_cursor, decode_cursor
+from src.services.import_export import import_contacts, export_rows, EXPORT_MEDIA_TYPES
+from src.services.rate_limit import RateLimiter
+from src.services.response_cache import response_cache
 
 router = APIRouter(prefix='/contacts', tags=['contacts'])
 finder = APIRouter(prefix='/contacts/find', tags=['find'])
@@ -15,29 +21,45 @@ finder = APIRouter(prefix='/contacts/find', tags=['find'])
 
 @router.get("/", response_model=List[ContactResponse], description='No more than 10 requests per minute',
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def get_all(skip: int = 0, limit: int = 10, cur_user: User = Depends(auth.get_current_user),
-                  db: Session = Depends(get_db)):
+async def get_all(request: Request, skip: int = 0, limit: int = Query(10, ge=1, le=1000), after: str | None = None,
+                  cur_user: User = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
     """
-    Returns a list of contacts with limits
+    Returns a list of contacts with limits, served from the response cache until the user changes data.
+    The ETag follows the data version, a current If-None-Match gets 304 without a query.
+    With fast_list_responses the page is encoded from plain rows, skipping the response model.
+    A full page carries the X-Next-Cursor header, pass it back as after= to get the next page
 
+    :param request: incoming request, used for the cache key
+    :type request: Request
     :param skip: skip number of contacts
     :type skip: int
     :param limit: part of the number of contacts
     :type limit: int
+    :param after: cursor from X-Next-Cursor of the previous page
+    :type after: str | None
     :param cur_user: current user - contact owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact
     :rtype: Contact
     """
-    contacts = await repository_contact.get_all(skip, limit, cur_user, db)
-    return contacts
+    after_id = decode_cursor(after, int)[0] if after else None
+    slot, cached = await response_cache.get(request, cur_user)
+    if cached is not None:
+        return cached
+    get_page = repository_contact.get_all_rows if settings.fast_list_responses else repository_contact.get_all
+    contacts = await get_page(skip, limit, cur_user, db, after=after_id)
+    headers = {'X-Next-Cursor': encode_cursor(contacts[-1].id)} if len(contacts) == limit else None
+    if settings.fast_list_responses:
+        return await response_cache.put_rows(slot, contacts, headers)
+    return await response_cache.put(slot, List[ContactResponse], contacts, headers)
 
 
 @router.post("/", response_model=ContactResponse, status_code=status.HTTP_201_CREATED, description='limit to create',
              dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def create(body: ContactModel, cur_user: User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def create(body: ContactModel, cur_user: User = Depends(auth.get_current_user),
+                 db: AsyncSession = Depends(get_db)):
     """
     route to create new contact
 
@@ -46,7 +68,7 @@ async def create(body: ContactModel, cur_user: User = Depends(auth.get_current_u
     :param cur_user: current user - note owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact
     :rtype: Contact
     """
@@ -57,30 +79,164 @@ async def create(body: ContactModel, cur_user: User = Depends(auth.get_current_u
     return contact
 
 
+@router.post("/import", response_model=ContactImportResponse, description='No more than 2 imports per minute',
+             dependencies=[Depends(RateLimiter(times=2, seconds=60))])
+async def import_file(file: UploadFile = File(), fmt: Literal['csv', 'ndjson'] | None = Query(None, alias='format'),
+                      cur_user: User = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    route to import contacts from a csv (with header) or ndjson file.
+    Contacts with an email that already exists are skipped, invalid rows are reported
+
+    :param file: uploaded csv or ndjson file
+    :type file: UploadFile
+    :param fmt: file format, guessed from the file name when omitted
+    :type fmt: str | None
+    :param cur_user: current user - contact owner
+    :type cur_user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: import report
+    :rtype: dict
+    """
+    if fmt is None:
+        fmt = 'csv' if (file.filename or '').lower().endswith('.csv') or file.content_type == 'text/csv' else 'ndjson'
+    try:
+        return await import_contacts(file.file, fmt, cur_user, db)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='File must be utf-8 encoded')
+
+
+@router.get("/search", response_model=List[ContactResponse])
+async def search(q: str = Query(min_length=1, max_length=100), skip: int = Query(0, ge=0),
+                 limit: int = Query(10, ge=1, le=100), cur_user: User = Depends(auth.get_current_user),
+                 db: AsyncSession = Depends(get_db)):
+    """
+    route to fuzzy search contacts by name, email or phone, best match first
+
+    :param q: search string, may be partial or misspelled
+    :type q: str
+    :param skip: skip number of matches
+    :type skip: int
+    :param limit: part of the number of matches
+    :type limit: int
+    :param cur_user: current user - contact owner
+    :type cur_user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: Contact
+    :rtype: List
+    """
+    contacts = await repository_contact.search(q, skip, limit, cur_user, db)
+    return contacts
+
+
+@router.get("/autocomplete", response_model=List[ContactSuggestion])
+async def autocomplete(q: str = Query(min_length=1, max_length=100), limit: int = Query(10, ge=1, le=50),
+                       cur_user: User = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    route to suggest contacts while typing, first or last name starts with q
+
+    :param q: typed beginning of the name
+    :type q: str
+    :param limit: max number of suggestions
+    :type limit: int
+    :param cur_user: current user - contact owner
+    :type cur_user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: suggestions
+    :rtype: List
+    """
+    return await repository_contact.autocomplete_names(q, limit, cur_user, db)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export(fmt: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'),
+                 cur_user: User = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    route to download all contacts as ndjson or csv, streamed from a server-side cursor
+
+    :param fmt: ndjson or csv
+    :type fmt: str
+    :param cur_user: current user - contact owner
+    :type cur_user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: streamed file
+    :rtype: StreamingResponse
+    """
+    result = await repository_contact.stream_all(cur_user, db)
+    return StreamingResponse(export_rows(result, fmt), media_type=EXPORT_MEDIA_TYPES[fmt],
+                             headers={'Content-Disposition': f'attachment; filename="contacts.{fmt}"'})
+
+
+@router.patch("/bulk", response_model=ContactBulkResponse)
+async def update_bulk(body: ContactBulkUpdate, cur_user: User = Depends(auth.get_current_user),
+                      db: AsyncSession = Depends(get_db)):
+    """
+    route to update many contacts picked by ids and/or filter in one statement
+
+    :param body: ids and/or filter with new values
+    :type body: ContactBulkUpdate
+    :param cur_user: current user - contact owner
+    :type cur_user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: ids of updated contacts
+    :rtype: dict
+    """
+    ids = await repository_contact.update_many(body, body.values.dict(exclude_none=True), cur_user, db)
+    return {"ids": ids}
+
+
+@router.delete("/bulk", response_model=ContactBulkResponse)
+async def delete_bulk(body: ContactBulkSelect, cur_user: User = Depends(auth.get_current_user),
+                      db: AsyncSession = Depends(get_db)):
+    """
+    route to delete many contacts picked by ids and/or filter in one statement
+
+    :param body: ids and/or filter
+    :type body: ContactBulkSelect
+    :param cur_user: current user - contact owner
+    :type cur_user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: ids of deleted contacts
+    :rtype: dict
+    """
+    ids = await repository_contact.delete_many(body, cur_user, db)
+    return {"ids": ids}
+
+
 @router.get("/{contact_id}", response_model=ContactResponse)
-async def get_one(contact_id: int = Path(ge=1), cur_user: User = Depends(auth.get_current_user),
-                  db: Session = Depends(get_db)):
+async def get_one(request: Request, contact_id: int = Path(ge=1), cur_user: User = Depends(auth.get_current_user),
+                  db: AsyncSession = Depends(get_db)):
     """
     route to get contact by id
 
+    :param request: incoming request, used for the cache key
+    :type request: Request
     :param contact_id: id of contact to found
     :type contact_id: int
     :param cur_user: current user - contact owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact
     :rtype: Contact
     """
+    slot, cached = await response_cache.get(request, cur_user)
+    if cached is not None:
+        return cached
     contact = await repository_contact.get_one(contact_id, cur_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not found')
-    return contact
+    return await response_cache.put(slot, ContactResponse, contact)
 
 
 @router.put("/{contact_id}", response_model=ContactResponse)
 async def update(body: ContactModel, contact_id: int = Path(ge=1), cur_user: User = Depends(auth.get_current_user),
-                 db: Session = Depends(get_db)):
+                 db: AsyncSession = Depends(get_db)):
     """
     update contact by db id
 
@@ -91,7 +247,7 @@ async def update(body: ContactModel, contact_id: int = Path(ge=1), cur_user: Use
     :param cur_user: current user - contact owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Note | None
     :rtype: Note | None
     """
@@ -104,7 +260,7 @@ async def update(body: ContactModel, contact_id: int = Path(ge=1), cur_user: Use
 
 @router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete(contact_id: int = Path(ge=1), cur_user: User = Depends(auth.get_current_user),
-                 db: Session = Depends(get_db)):
+                 db: AsyncSession = Depends(get_db)):
     """
     route to delete contact by contact id
 
@@ -113,7 +269,7 @@ async def delete(contact_id: int = Path(ge=1), cur_user: User = Depends(auth.get
     :param cur_user: current user - contact owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
@@ -124,78 +280,97 @@ async def delete(contact_id: int = Path(ge=1), cur_user: User = Depends(auth.get
 
 
 @finder.get("/name/{contact_name}", response_model=ContactResponse)
-async def find_by_name(contact_name: str, cur_user: User = Depends(auth.get_current_user),
-                       db: Session = Depends(get_db)):
+async def find_by_name(request: Request, contact_name: str, cur_user: User = Depends(auth.get_current_user),
+                       db: AsyncSession = Depends(get_db)):
     """
     route to get contact by contact name
 
+    :param request: incoming request, used for the cache key
+    :type request: Request
     :param contact_name: name of contact to found
     :type contact_name: str
     :param cur_user: current user - contact owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
+    slot, cached = await response_cache.get(request, cur_user)
+    if cached is not None:
+        return cached
     contact = await repository_contact.find_by_name(contact_name, cur_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not found')
-    return contact
+    return await response_cache.put(slot, ContactResponse, contact)
 
 
 @finder.get("/lastname/{lastname}", response_model=ContactResponse)
-async def find_by_lastname(lastname: str, cur_user: User = Depends(auth.get_current_user),
-                           db: Session = Depends(get_db)):
+async def find_by_lastname(request: Request, lastname: str, cur_user: User = Depends(auth.get_current_user),
+                           db: AsyncSession = Depends(get_db)):
     """
     route to get contact by lastname
 
+    :param request: incoming request, used for the cache key
+    :type request: Request
     :param lastname: lastname of contact to found
     :type lastname: str
     :param cur_user: current user - contact owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
+    slot, cached = await response_cache.get(request, cur_user)
+    if cached is not None:
+        return cached
     contact = await repository_contact.find_by_lastname(lastname, cur_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not found')
-    return contact
+    return await response_cache.put(slot, ContactResponse, contact)
 
 
 @finder.get("/email/{email}", response_model=ContactResponse)
-async def find_by_email(email: str, cur_user: User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def find_by_email(request: Request, email: str, cur_user: User = Depends(auth.get_current_user),
+                        db: AsyncSession = Depends(get_db)):
     """
     route to get contact by email address
 
+    :param request: incoming request, used for the cache key
+    :type request: Request
     :param email: email of contact to found
     :type email: str
     :param cur_user: current user - contact owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact | None
     :rtype: Contact | None
     """
+    slot, cached = await response_cache.get(request, cur_user)
+    if cached is not None:
+        return cached
     contact = await repository_contact.find_by_email(email, cur_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not found')
-    return contact
+    return await response_cache.put(slot, ContactResponse, contact)
 
 
 @finder.get("/birthday/", response_model=List[ContactResponse])
-async def get_all(cur_user: User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def get_all(days: int = Query(7, ge=0, le=365), cur_user: User = Depends(auth.get_current_user),
+                  db: AsyncSession = Depends(get_db)):
     """
-    route to get contact with bithday in 7 days
+    route to get contact with bithday in the next days
 
+    :param days: how many days ahead to look, 7 by default
+    :type days: int
     :param cur_user: current user - contact owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Contact
     :rtype: List
     """
-    contacts = await repository_contact.find_birthday7day(cur_user, db)
+    contacts = await repository_contact.find_upcoming_birthdays(days, cur_user, db)
     return contacts
@@ -1,34 +1,66 @@
-from typing import List
-from fastapi import APIRouter, Depends, status, HTTPException, Path
+from typing import List, Literal
+from fastapi import APIRouter, Depends, status, HTTPException, Path, Query, Request
+from fastapi.responses import StreamingResponse
 
+from src.conf.config import settings
 from src.database.models import User
 from src.repository import notes as repository_notes
-from src.schemas import NoteResponse, NoteModel
-from sqlalchemy.orm import Session
+from src.schemas import NoteResponse, NoteContactResponse, NoteModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.connector import get_db
 from src.services.auth import auth_service as auth
+from src.services.cursor import encode_cursor, decode_cursor
+from src.services.import_export import export_rows, EXPORT_MEDIA_TYPES
+from src.services.response_cache import response_cache
 
 router = APIRouter(prefix='/note', tags=['note'])
 
 
-@router.get("/", response_model=List[NoteResponse])
-async def get_all(cur_user: User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+@router.get("/", response_model=List[NoteContactResponse])
+async def get_all(request: Request, limit: int = Query(100, ge=1, le=1000), after: str | None = None,
+                  include: Literal['contact'] | None = None, cur_user: User = Depends(auth.get_current_user),
+                  db: AsyncSession = Depends(get_db)):
     """
-    get all notes
-
+    get a page of notes, served from the response cache until the user changes data.
+    A full page carries the X-Next-Cursor header, pass it back as after= to get the next page.
+    include=contact adds the contact of every note, loaded for the whole page with one more query.
+    The ETag follows the data version, a current If-None-Match gets 304 without a query.
+    With fast_list_responses the notes are encoded from plain rows, skipping the response model
+
+    :param request: incoming request, used for the cache key
+    :type request: Request
+    :param limit: part of the number of notes
+    :type limit: int
+    :param after: cursor from X-Next-Cursor of the previous page
+    :type after: str | None
+    :param include: contact to embed the contact of every note
+    :type include: str | None
     :param cur_user: current user - note owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
-    :return: all notes in database for current user
+    :type db: AsyncSession
+    :return: notes of current user
     :rtype: List
     """
-    notes = await repository_notes.get_all(cur_user, db)
-    return notes
+    after_id = decode_cursor(after, int)[0] if after else None
+    slot, cached = await response_cache.get(request, cur_user)
+    if cached is not None:
+        return cached
+    with_contact = include == 'contact'
+    if settings.fast_list_responses and not with_contact:
+        notes = await repository_notes.get_all_rows(limit, cur_user, db, after=after_id)
+    else:
+        notes = await repository_notes.get_all(limit, cur_user, db, after=after_id, with_contact=with_contact)
+    headers = {'X-Next-Cursor': encode_cursor(notes[-1].id)} if len(notes) == limit else None
+    if with_contact:
+        return await response_cache.put(slot, List[NoteContactResponse], notes, headers)
+    if settings.fast_list_responses:
+        return await response_cache.put_rows(slot, notes, headers)
+    return await response_cache.put(slot, List[NoteResponse], notes, headers)
 
 
 @router.post("/", response_model=NoteResponse, status_code=status.HTTP_201_CREATED)
-async def create(body: NoteModel, cur_user: User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def create(body: NoteModel, cur_user: User = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
     """
     create new note by db id
 
@@ -37,16 +69,38 @@ async def create(body: NoteModel, cur_user: User = Depends(auth.get_current_user
     :param cur_user: current user - note owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Note | None
     :rtype: Note | None
     """
     note = await repository_notes.create(body, cur_user, db)
+    if note is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact not found')
     return note
 
 
+@router.get("/export", response_class=StreamingResponse)
+async def export(fmt: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'),
+                 cur_user: User = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    route to download all notes as ndjson or csv, streamed from a server-side cursor
+
+    :param fmt: ndjson or csv
+    :type fmt: str
+    :param cur_user: current user - note owner
+    :type cur_user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: streamed file
+    :rtype: StreamingResponse
+    """
+    result = await repository_notes.stream_all(cur_user, db)
+    return StreamingResponse(export_rows(result, fmt), media_type=EXPORT_MEDIA_TYPES[fmt],
+                             headers={'Content-Disposition': f'attachment; filename="notes.{fmt}"'})
+
+
 @router.get("/{note_id}", response_model=NoteResponse)
-async def get_one(note_id: int = Path(ge=1), cur_user: User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def get_one(note_id: int = Path(ge=1), cur_user: User = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
     """
     get note by db id
 
@@ -55,7 +109,7 @@ async def get_one(note_id: int = Path(ge=1), cur_user: User = Depends(auth.get_c
     :param cur_user: current user - note owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Note | None
     :rtype: Note | None
     """
@@ -66,7 +120,7 @@ async def get_one(note_id: int = Path(ge=1), cur_user: User = Depends(auth.get_c
 
 
 @router.put("/{note_id}", response_model=NoteResponse)
-async def update(body: NoteModel, note_id: int = Path(ge=1), cur_user: User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def update(body: NoteModel, note_id: int = Path(ge=1), cur_user: User = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
     """
     update note by db id
 
@@ -77,7 +131,7 @@ async def update(body: NoteModel, note_id: int = Path(ge=1), cur_user: User = De
     :param cur_user: current user - note owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Note | None
     :rtype: Note | None
     """
@@ -88,7 +142,7 @@ async def update(body: NoteModel, note_id: int = Path(ge=1), cur_user: User = De
 
 
 @router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete(note_id: int = Path(ge=1), cur_user: User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def delete(note_id: int = Path(ge=1), cur_user: User = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
     """
     detele note finded by db id
 
@@ -97,7 +151,7 @@ async def delete(note_id: int = Path(ge=1), cur_user: User = Depends(auth.get_cu
     :param cur_user: current user - note owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: Note | None
     :rtype: Note | None
     """
@@ -1,17 +1,21 @@
-from fastapi import APIRouter, Depends, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from fastapi import APIRouter, Depends, UploadFile, File, Header, HTTPException, Path, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.connector import get_db
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service as auth
-from src.conf.config import settings
+from src.services.avatars import avatars
+from src.services.conditional import etag_matches
 from src.schemas import UserDb
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+AVATAR_NAME = r'^[0-9a-f]{64}-[0-9]+\.jpg$'
+# avatar names are content hashes, a name never changes its content
+AVATAR_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 
 @router.get("/me/", response_model=UserDb)
 async def read_users_me(cur_user: User = Depends(auth.get_current_user)):
@@ -28,27 +32,41 @@ async def read_users_me(cur_user: User = Depends(auth.get_current_user)):
 
 @router.patch('/avatar', response_model=UserDb)
 async def update_avatar_user(file: UploadFile = File(), cur_user: User = Depends(auth.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
     """
-    route for upload file
+    route for upload file, resized to a square thumbnail off the event loop
 
-    :param file: url of new avatar file
-    :type file: str
+    :param file: new avatar image
+    :type file: UploadFile
     :param cur_user: current user - contact owner
     :type cur_user: User
     :param db: current session to db
-    :type db: Session
+    :type db: AsyncSession
     :return: user | None
     :rtype: User | None
     """
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-    cloudinary.uploader.upload(file.file, public_id=f'NotesApp/{cur_user.name}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'NotesApp/{cur_user.name}').build_url(width=250, height=250, crop='fill')
+    src_url = await avatars.save(file)
     user = await repository_users.update_avatar(cur_user.email, src_url, db)
     return user
 
+
+@router.get('/avatars/{name}', response_class=FileResponse)
+async def get_avatar(name: str = Path(regex=AVATAR_NAME), if_none_match: str | None = Header(None)):
+    """
+    route to a stored avatar, 304 without reading the file when the client copy is current
+
+    :param name: content addressed file name
+    :type name: str
+    :param if_none_match: entity tags cached by the client
+    :type if_none_match: str | None
+    :return: jpeg avatar
+    :rtype: FileResponse
+    """
+    path = await avatars.storage.local_file(name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    headers = {"ETag": f'"{name.removesuffix(".jpg")}"', "Cache-Control": AVATAR_CACHE_CONTROL}
+    # stored files never change, a matching tag is answered without reading the file
+    if etag_matches(headers["ETag"], if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path, media_type='image/jpeg', headers=headers)
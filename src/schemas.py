@@ -1,5 +1,6 @@
 from datetime import datetime
-from pydantic import BaseModel, Field, EmailStr
+from typing import List
+from pydantic import BaseModel, Field, EmailStr, root_validator
 
 
 class UserModel(BaseModel):
@@ -13,6 +14,7 @@ class UserDb(BaseModel):
     name: str
     email: str
     created_at: datetime
+    avatar: str | None
 
     class Config:
         orm_mode = True
@@ -50,6 +52,64 @@ class ContactResponse(ContactModel):
         orm_mode = True
 
 
+class ContactSuggestion(BaseModel):
+    id: int
+    first_name: str | None
+    last_name: str | None
+
+
+class ContactFilter(BaseModel):
+    first_name: str | None = None
+    last_name: str | None = None
+    email: EmailStr | None = None
+
+
+class ContactBulkSelect(BaseModel):
+    ids: List[int] | None = Field(None, min_items=1, max_items=1000)
+    filter: ContactFilter | None = None
+
+    @root_validator(skip_on_failure=True)
+    def check_selection(cls, values):
+        contact_filter = values.get('filter')
+        if not values.get('ids') and not (contact_filter and contact_filter.dict(exclude_none=True)):
+            raise ValueError('ids or filter is required')
+        return values
+
+
+class ContactValues(BaseModel):
+    first_name: str | None = Field(None, max_length=150, min_length=1)
+    last_name: str | None = Field(None, max_length=150, min_length=1)
+    phone: str | None = Field(None, max_length=14, min_length=6,
+                              regex=r"\d{3}\-\d{3}\-\d{2}\-\d{2}|\d{3}\-\d{3}\-\d{4}|\(\d{3}\)\d{7}|\d{10}|\+\d{12}$")
+    birthday: datetime | None = None
+
+
+class ContactBulkUpdate(ContactBulkSelect):
+    values: ContactValues
+
+    @root_validator(skip_on_failure=True)
+    def check_values(cls, values):
+        if not values['values'].dict(exclude_none=True):
+            raise ValueError('values must set at least one field')
+        return values
+
+
+class ContactBulkResponse(BaseModel):
+    ids: List[int]
+
+
+class RowError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class ContactImportResponse(BaseModel):
+    imported: int
+    duplicates: int
+    failed: int
+    errors: List[RowError]
+
+
 class NoteModel(BaseModel):
     text: str = Field(max_length=1000, min_length=1)
     contact_id: int = Field(1, gt=0)
@@ -58,12 +118,15 @@ class NoteModel(BaseModel):
 class NoteResponse(NoteModel):
     id: int
     text: str
-    contact = ContactResponse
 
     class Config:
         orm_mode = True
 
 
+class NoteContactResponse(NoteResponse):
+    contact: ContactResponse | None = None
+
+
 class RequestEmail(BaseModel):
     email: EmailStr
 
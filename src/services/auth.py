@@ -1,25 +1,29 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
-
-import redis as redis
-import pickle
+from uuid import uuid4
 
 from src.conf.config import settings
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.connector import get_db
 from src.repository import users
+from src.services.token_cache import token_cache
+from src.services.user_cache import user_cache
 from jose import jwt, JWTError
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
+    # bcrypt releases the GIL, so a few threads keep hashing off the event loop without a process pool
+    hash_executor = ThreadPoolExecutor(max_workers=settings.hash_workers, thread_name_prefix='bcrypt')
+    hash_pending = 0
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    redis_db = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
 
     def create_email_token(self, data: dict):
         """
@@ -54,7 +58,25 @@ class Auth:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail="Invalid token for email verification")
 
-    def get_hash(self, password: str):
+    async def _hashing(self, func, *args):
+        """
+        Run a bcrypt call in hash_executor, refuse new work while hash_max_pending calls are queued
+
+        :param func: pwd_context method
+        :type func: Callable
+        :param args: arguments of the call
+        :return: result of the call
+        """
+        if self.hash_pending >= settings.hash_max_pending:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many password checks, try again", headers={"Retry-After": "1"})
+        self.hash_pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.hash_executor, func, *args)
+        finally:
+            self.hash_pending -= 1
+
+    async def get_hash(self, password: str):
         """
         password hash
 
@@ -63,29 +85,29 @@ class Auth:
         :return: hash
         :rtype: str
         """
-        return self.pwd_context.hash(secret=password)
+        return await self._hashing(self.pwd_context.hash, password)
 
-    def verify_password(self, plain_password, password_hash):
+    async def verify_password(self, plain_password, password_hash):
         """
-        password hash
+        verify password and rehash it when the hash uses another cost factor
 
         :param plain_password: password
         :type plain_password: str
         :param password_hash: hashstring
         :type password_hash: str
-        :return: verify result
-        :rtype: bool
+        :return: verify result and a new hash or None
+        :rtype: tuple[bool, str | None]
         """
-        return self.pwd_context.verify(secret=plain_password, hash=password_hash)
+        return await self._hashing(self.pwd_context.verify_and_update, plain_password, password_hash)
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         get user by token
 
         :param token: token to get user
         :type token: token
         :param db: current session to db
-        :type db: Session
+        :type db: AsyncSession
         :return: user
         :rtype: bool
         """
@@ -94,25 +116,25 @@ class Auth:
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-        try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
+        email = token_cache.get(token)
+        if email is None:
+            try:
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+                if payload['scope'] == 'access_token':
+                    email = payload["sub"]
+                    if email is None:
+                        raise credentials_exception
+                else:
                     raise credentials_exception
-            else:
+            except JWTError as err:
                 raise credentials_exception
-        except JWTError as err:
-            raise credentials_exception
-        user = self.redis_db.get(f'user:{email}')
+            token_cache.put(token, email, payload["exp"])
+        user = await user_cache.get(email)
         if user is None:
             user = await users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            self.redis_db.set(f"user:{email}", pickle.dumps(user))
-            self.redis_db.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
+            await user_cache.set(user)
         return user
 
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -150,8 +172,9 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=1)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
+            expire = datetime.utcnow() + timedelta(seconds=settings.refresh_token_ttl)
+        # jti keeps tokens issued within the same second distinct, rotation relies on it
+        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token", "jti": uuid4().hex})
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
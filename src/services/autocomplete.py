@@ -0,0 +1,163 @@
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import Contact, User
+
+
+class PrefixIndex:
+    """
+    Contact names of one user as a sorted array of (lowercase name, contact id),
+    every prefix match is one contiguous slice found by binary search
+    """
+
+    def __init__(self, rows=()):
+        self.names = {}
+        self.keys = []
+        for contact_id, first_name, last_name in rows:
+            self.names[contact_id] = (first_name, last_name)
+            self.keys.extend(self._keys(contact_id, first_name, last_name))
+        self.keys.sort()
+        self.built_at = time.monotonic()
+
+    @staticmethod
+    def _keys(contact_id, first_name, last_name):
+        return {(name.lower(), contact_id) for name in (first_name, last_name) if name}
+
+    def add(self, contact_id: int, first_name: str, last_name: str) -> None:
+        """
+        Add or replace a contact
+
+        :param contact_id: contact id in db
+        :type contact_id: int
+        :param first_name: first name of contact
+        :type first_name: str
+        :param last_name: last name of contact
+        :type last_name: str
+        :return: None
+        :rtype: None
+        """
+        self.remove(contact_id)
+        self.names[contact_id] = (first_name, last_name)
+        for key in self._keys(contact_id, first_name, last_name):
+            insort(self.keys, key)
+
+    def remove(self, contact_id: int) -> None:
+        """
+        Remove a contact if it is indexed
+
+        :param contact_id: contact id in db
+        :type contact_id: int
+        :return: None
+        :rtype: None
+        """
+        names = self.names.pop(contact_id, None)
+        if names is None:
+            return
+        for key in self._keys(contact_id, *names):
+            i = bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                del self.keys[i]
+
+    def search(self, prefix: str, limit: int) -> list:
+        """
+        Contacts whose first or last name starts with prefix
+
+        :param prefix: beginning of the name, case insensitive
+        :type prefix: str
+        :param limit: max number of suggestions
+        :type limit: int
+        :return: suggestions ordered by the matched name
+        :rtype: list
+        """
+        prefix = prefix.lower()
+        found = {}
+        i = bisect_left(self.keys, (prefix,))
+        while i < len(self.keys) and len(found) < limit and self.keys[i][0].startswith(prefix):
+            contact_id = self.keys[i][1]
+            if contact_id not in found:
+                first_name, last_name = self.names[contact_id]
+                found[contact_id] = {"id": contact_id, "first_name": first_name, "last_name": last_name}
+            i += 1
+        return list(found.values())
+
+
+class AutocompleteCache:
+    """
+    Prefix indexes of recently active users, least recently used are evicted.
+    Indexes are rebuilt after ttl seconds, which bounds staleness from writes made by other workers
+    """
+
+    def __init__(self, max_users: int, ttl: float):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.indexes = OrderedDict()
+
+    async def get(self, user: User, db: AsyncSession) -> PrefixIndex:
+        """
+        Prefix index of the user, built from db on first use
+
+        :param user: current user - contact owner
+        :type user: User
+        :param db: current session to db
+        :type db: AsyncSession
+        :return: prefix index
+        :rtype: PrefixIndex
+        """
+        index = self.indexes.get(user.id)
+        if index is not None and time.monotonic() - index.built_at < self.ttl:
+            self.indexes.move_to_end(user.id)
+            return index
+        rows = await db.execute(
+            select(Contact.id, Contact.first_name, Contact.last_name).filter(Contact.user_id == user.id)
+        )
+        index = PrefixIndex(rows.all())
+        self.indexes[user.id] = index
+        self.indexes.move_to_end(user.id)
+        while len(self.indexes) > self.max_users:
+            self.indexes.popitem(last=False)
+        return index
+
+    def saved(self, contact: Contact) -> None:
+        """
+        Reflect a created or updated contact in an already built index
+
+        :param contact: contact after commit
+        :type contact: Contact
+        :return: None
+        :rtype: None
+        """
+        index = self.indexes.get(contact.user_id)
+        if index is not None:
+            index.add(contact.id, contact.first_name, contact.last_name)
+
+    def removed(self, contact: Contact) -> None:
+        """
+        Drop a deleted contact from an already built index
+
+        :param contact: deleted contact
+        :type contact: Contact
+        :return: None
+        :rtype: None
+        """
+        index = self.indexes.get(contact.user_id)
+        if index is not None:
+            index.remove(contact.id)
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Forget the index of a user, the next lookup rebuilds it
+
+        :param user_id: contact owner id
+        :type user_id: int
+        :return: None
+        :rtype: None
+        """
+        self.indexes.pop(user_id, None)
+
+
+autocomplete = AutocompleteCache(max_users=settings.autocomplete_max_users, ttl=settings.autocomplete_ttl)
@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from uuid import uuid4
+
+import cloudinary
+import cloudinary.uploader
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from src.conf.config import settings
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def make_thumbnail(data: bytes, size: int) -> bytes:
+    """
+    Crop and resize an image to a square jpeg, runs in a worker process
+
+    :param data: uploaded image
+    :type data: bytes
+    :param size: side of the thumbnail in pixels
+    :type size: int
+    :return: jpeg thumbnail
+    :rtype: bytes
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        thumbnail = ImageOps.fit(image.convert('RGB'), (size, size), Image.LANCZOS)
+    output = io.BytesIO()
+    thumbnail.save(output, format='JPEG', quality=85, optimize=True)
+    return output.getvalue()
+
+
+class AvatarStorage(ABC):
+    """
+    Where avatar thumbnails are kept under content addressed names, implementations return public urls.
+    Names are derived from the content, so a stored file never changes and save may skip existing files
+    """
+
+    async def find(self, name: str) -> str | None:
+        """
+        Url of an already stored file, so identical uploads are not processed again
+
+        :param name: file name
+        :type name: str
+        :return: url or None if the file has to be saved
+        :rtype: str | None
+        """
+        return None
+
+    async def local_file(self, name: str) -> Path | None:
+        """
+        Path of a stored file the app can serve itself
+
+        :param name: file name
+        :type name: str
+        :return: path or None if the file is missing or kept elsewhere
+        :rtype: Path | None
+        """
+        return None
+
+    @abstractmethod
+    async def save(self, name: str, data: bytes) -> str:
+        """
+        Store a thumbnail
+
+        :param name: file name
+        :type name: str
+        :param data: file content
+        :type data: bytes
+        :return: public url of the file
+        :rtype: str
+        """
+
+
+class FileSystemStorage(AvatarStorage):
+    """
+    Avatars as write-once files in a local directory, sharded by the first two characters of the name.
+    Files are served by the avatar endpoint under base_url
+    """
+
+    def __init__(self, directory: str | Path, base_url: str):
+        self.directory = Path(directory)
+        self.base_url = base_url.rstrip('/')
+
+    def path(self, name: str) -> Path:
+        return self.directory / name[:2] / name
+
+    def url(self, name: str) -> str:
+        return f'{self.base_url}/{name}'
+
+    def _write(self, name: str, data: bytes) -> None:
+        path = self.path(name)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'.{name}.{uuid4().hex}.tmp')
+        tmp_path.write_bytes(data)
+        # readers never see a half written file
+        os.replace(tmp_path, path)
+
+    async def find(self, name: str) -> str | None:
+        """
+        Url of the file if it is already stored
+
+        :param name: file name
+        :type name: str
+        :return: url or None
+        :rtype: str | None
+        """
+        return self.url(name) if await self.local_file(name) else None
+
+    async def local_file(self, name: str) -> Path | None:
+        """
+        Path of the file if it is stored
+
+        :param name: file name
+        :type name: str
+        :return: path or None
+        :rtype: Path | None
+        """
+        path = self.path(name)
+        return path if await run_in_threadpool(path.is_file) else None
+
+    async def save(self, name: str, data: bytes) -> str:
+        """
+        Write the file off the event loop
+
+        :param name: file name
+        :type name: str
+        :param data: file content
+        :type data: bytes
+        :return: url of the file
+        :rtype: str
+        """
+        await run_in_threadpool(self._write, name, data)
+        return self.url(name)
+
+
+class CloudinaryStorage(AvatarStorage):
+    """
+    Avatars uploaded to Cloudinary under the folder prefix
+    """
+
+    def __init__(self, folder: str = 'NotesApp'):
+        self.folder = folder
+        cloudinary.config(
+            cloud_name=settings.cloudinary_name,
+            api_key=settings.cloudinary_api_key,
+            api_secret=settings.cloudinary_api_secret,
+            secure=True
+        )
+
+    async def save(self, name: str, data: bytes) -> str:
+        """
+        Upload the file in a worker thread
+
+        :param name: file name
+        :type name: str
+        :param data: file content
+        :type data: bytes
+        :return: url of the uploaded file
+        :rtype: str
+        """
+        result = await run_in_threadpool(cloudinary.uploader.upload, data, overwrite=True,
+                                         public_id=f'{self.folder}/{Path(name).stem}')
+        return result['secure_url']
+
+
+class AvatarService:
+    """
+    Reads an uploaded image up to max_bytes, makes the thumbnail in a process pool and hands it to the storage
+    """
+
+    def __init__(self, storage: AvatarStorage, max_bytes: int, size: int = 250, workers: int = 2):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.size = size
+        self.workers = workers
+        self.executor = None
+
+    async def read(self, file: UploadFile) -> bytes:
+        """
+        Read the upload in chunks, refusing files over max_bytes
+
+        :param file: uploaded file
+        :type file: UploadFile
+        :return: file content
+        :rtype: bytes
+        """
+        data = bytearray()
+        while chunk := await file.read(READ_CHUNK_SIZE):
+            data += chunk
+            if len(data) > self.max_bytes:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                    detail=f"Avatar is larger than {self.max_bytes} bytes")
+        return bytes(data)
+
+    async def thumbnail(self, data: bytes) -> bytes:
+        """
+        Thumbnail of the image made in a worker process
+
+        :param data: uploaded image
+        :type data: bytes
+        :return: jpeg thumbnail
+        :rtype: bytes
+        """
+        if self.executor is None:
+            self.start()
+        executor = self.executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, make_thumbnail, data, self.size)
+        except BrokenProcessPool:
+            # a worker died, e.g. killed for memory, the next upload gets a fresh pool
+            if self.executor is executor:
+                self.shutdown()
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Try again later")
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid image")
+
+    async def save(self, file: UploadFile) -> str:
+        """
+        Store the thumbnail of an uploaded avatar under the hash of the upload,
+        an image that is already stored is neither resized nor written again
+
+        :param file: uploaded file
+        :type file: UploadFile
+        :return: url of the avatar
+        :rtype: str
+        """
+        data = await self.read(file)
+        name = f'{hashlib.sha256(data).hexdigest()}-{self.size}.jpg'
+        url = await self.storage.find(name)
+        if url is None:
+            url = await self.storage.save(name, await self.thumbnail(data))
+        return url
+
+    def start(self) -> None:
+        """
+        Start the worker processes. Workers are spawned fresh instead of forked,
+        so they do not inherit the event loop, open sockets and locks of the app process
+
+        :return: None
+        :rtype: None
+        """
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+
+if settings.avatar_storage == 'filesystem':
+    avatar_storage = FileSystemStorage(settings.avatar_dir, settings.avatar_url)
+else:
+    avatar_storage = CloudinaryStorage()
+avatars = AvatarService(avatar_storage, max_bytes=settings.avatar_max_bytes, size=settings.avatar_size,
+                        workers=settings.avatar_workers)
@@ -0,0 +1,125 @@
+import asyncio
+from datetime import date, datetime, time, timedelta
+from itertools import groupby
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.conf.config import settings
+from src.database.connector import DBSession
+from src.repository import contacts as repository_contacts
+from src.repository import digests as repository_digests
+from src.repository import outbox as repository_outbox
+from src.repository import users as repository_users
+from src.services.email import MailDispatcher, mail_dispatcher
+
+
+class BirthdayDigest:
+    """
+    Nightly job that emails every confirmed user the birthdays of their contacts in the next days.
+    Users are walked by id in chunks, birthdays of a chunk come from one indexed query,
+    and the digests of a chunk are stored in the outbox in the same transaction that records progress,
+    so a restarted or parallel run continues after the last finished chunk and never sends a digest twice
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, dispatcher: MailDispatcher, days: int = 7,
+                 chunk_size: int = 500, hour: int = 6):
+        self.session_factory = session_factory
+        self.dispatcher = dispatcher
+        self.days = days
+        self.chunk_size = chunk_size
+        self.hour = hour
+
+    def digests(self, users: list, birthdays: list) -> list[dict]:
+        """
+        One email per user with upcoming birthdays
+
+        :param users: rows of id, name, email
+        :type users: list
+        :param birthdays: rows of user_id, first_name, last_name, birthday grouped by user
+        :type birthdays: list
+        :return: emails for the outbox
+        :rtype: list[dict]
+        """
+        by_user = {user_id: list(rows) for user_id, rows in groupby(birthdays, key=lambda row: row.user_id)}
+        emails = []
+        for user in users:
+            rows = by_user.get(user.id)
+            if not rows:
+                continue
+            emails.append({
+                "recipient": user.email,
+                "subject": "Upcoming birthdays",
+                "template": "birthday_digest.html",
+                "template_body": {
+                    "username": user.name,
+                    "days": self.days,
+                    "birthdays": [{"name": f"{row.first_name} {row.last_name}", "date": row.birthday.strftime('%d.%m')}
+                                  for row in rows],
+                },
+            })
+        return emails
+
+    async def _chunk(self, run_date: date, last_user_id: int) -> list[int]:
+        async with self.session_factory() as db:
+            users = await repository_users.confirmed_after(last_user_id, self.chunk_size, db)
+            if not users:
+                await repository_digests.finish(run_date, db)
+                return []
+            birthdays = await repository_contacts.upcoming_birthdays_of_users(
+                [user.id for user in users], self.days, run_date, db
+            )
+            emails = self.digests(users, birthdays)
+            if not await repository_digests.advance(run_date, last_user_id, users[-1].id, len(users), len(emails), db):
+                await db.rollback()
+                return []
+            ids = await repository_outbox.enqueue_many(emails, db)
+            await db.commit()
+            return ids
+
+    async def run(self, run_date: date) -> dict:
+        """
+        Send the digests of a day, continuing a run that was interrupted
+
+        :param run_date: day of the run, first day of the birthday window
+        :type run_date: date
+        :return: users walked and digests queued by the run
+        :rtype: dict
+        """
+        while True:
+            async with self.session_factory() as db:
+                run = await repository_digests.get_run(run_date, db)
+            if run.finished_at is not None:
+                return {"users": run.users, "digests": run.digests}
+            for email_id in await self._chunk(run_date, run.last_user_id):
+                await self.dispatcher.put(email_id)
+
+    async def schedule(self) -> None:
+        """
+        Run the job every day at the configured hour (UTC) until cancelled.
+        A run missed or interrupted today is resumed right away
+
+        :return: None
+        :rtype: None
+        """
+        while True:
+            now = datetime.utcnow()
+            run_at = datetime.combine(now.date(), time(self.hour))
+            if now >= run_at:
+                try:
+                    await self.run(now.date())
+                except Exception as err:
+                    # whatever failed, the run is resumed from its last finished chunk
+                    print(err)
+                    await asyncio.sleep(60)
+                    continue
+                run_at += timedelta(days=1)
+            await asyncio.sleep((run_at - datetime.utcnow()).total_seconds())
+
+
+birthday_digest = BirthdayDigest(
+    DBSession,
+    mail_dispatcher,
+    days=settings.birthday_digest_days,
+    chunk_size=settings.birthday_digest_chunk_size,
+    hour=settings.birthday_digest_hour,
+)
@@ -0,0 +1,17 @@
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    """
+    If-None-Match check with the weak comparison required for GET
+
+    :param etag: current entity tag, quoted
+    :type etag: str
+    :param if_none_match: value of the If-None-Match header
+    :type if_none_match: str | None
+    :return: True if the client copy is current and 304 can be sent
+    :rtype: bool
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == opaque for tag in if_none_match.split(','))
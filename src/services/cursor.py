@@ -0,0 +1,39 @@
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(*keys) -> str:
+    """
+    Pack the sort key of the last row into an opaque cursor
+
+    :param keys: sort key values of the last returned row
+    :type keys: tuple
+    :return: url-safe cursor
+    :rtype: str
+    """
+    raw = json.dumps(keys, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, *types: type) -> list:
+    """
+    Unpack a cursor made by encode_cursor
+
+    :param cursor: cursor from the client
+    :type cursor: str
+    :param types: expected type of every sort key value
+    :type types: type
+    :return: sort key values
+    :rtype: list
+    """
+    try:
+        keys = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        keys = None
+    if not isinstance(keys, list) or len(keys) != len(types) \
+            or not all(isinstance(key, key_type) for key, key_type in zip(keys, types)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+    return keys
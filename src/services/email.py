@@ -1,10 +1,18 @@
+import asyncio
+import json
+from email.message import Message
 from pathlib import Path
 
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from fastapi_mail import ConnectionConfig, MessageSchema, MessageType
+from fastapi_mail.msg import MailMsg
 from pydantic import EmailStr
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from src.conf.config import settings
+from src.database.connector import DBSession
+from src.database.models import OutboxEmail
+from src.repository import outbox as repository_outbox
 from src.services.auth import auth_service
 
 conf = ConnectionConfig(
@@ -22,9 +30,216 @@ conf = ConnectionConfig(
 )
 
 
-async def send_email(email: EmailStr, username: str, host: str):
+class MailDispatcher:
     """
-    Sends an email
+    Sends emails of the outbox table from a bounded queue.
+    Every worker keeps one SMTP connection open and sends a whole batch over it,
+    failed emails are retried with exponential backoff, and a sweeper requeues due emails
+    left in the outbox after a full queue, a failure or a restart
+    """
+
+    def __init__(self, config: ConnectionConfig, session_factory: async_sessionmaker, connections: int = 2,
+                 queue_size: int = 1000, batch_size: int = 20, max_attempts: int = 5, retry_delay: float = 30,
+                 sweep_interval: float = 60, lease: float = 300):
+        self.config = config
+        self.session_factory = session_factory
+        self.connections = connections
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.sweep_interval = sweep_interval
+        self.lease = lease
+        self.templates = config.template_engine()
+        self.sender = f"{config.MAIL_FROM_NAME} <{config.MAIL_FROM}>" if config.MAIL_FROM_NAME else config.MAIL_FROM
+        self.queue = None
+        self.queued = set()
+        self.workers = []
+        self.sweeper = None
+        self.closing = False
+
+    async def start(self) -> None:
+        """
+        Start the sending workers and the sweeper on the running loop
+
+        :return: None
+        :rtype: None
+        """
+        self.closing = False
+        self.queue = asyncio.Queue(self.queue_size)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.connections)]
+        self.sweeper = asyncio.create_task(self._sweeper())
+
+    async def stop(self) -> None:
+        """
+        Let the workers finish the batches in progress and stop them, queued emails stay in the outbox
+
+        :return: None
+        :rtype: None
+        """
+        self.closing = True
+        self.sweeper.cancel()
+        for _ in self.workers:
+            try:
+                # wake up idle workers, a full queue wakes them anyway
+                self.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                break
+        _, pending = await asyncio.wait(self.workers, timeout=self.config.TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(self.sweeper, *self.workers, return_exceptions=True)
+        self.workers = []
+        self.queue = None
+        self.queued.clear()
+
+    def submit(self, email_id: int) -> bool:
+        """
+        Queue a stored email without waiting
+
+        :param email_id: id of the email in the outbox
+        :type email_id: int
+        :return: False if the dispatcher is stopped or full, the sweeper sends the email later
+        :rtype: bool
+        """
+        if self.queue is None or self.closing or email_id in self.queued:
+            return False
+        try:
+            self.queue.put_nowait(email_id)
+        except asyncio.QueueFull:
+            return False
+        self.queued.add(email_id)
+        return True
+
+    async def put(self, email_id: int) -> bool:
+        """
+        Queue a stored email, waiting while the queue is full, so bulk jobs go at the pace of sending
+
+        :param email_id: id of the email in the outbox
+        :type email_id: int
+        :return: False if the dispatcher is stopped, the sweeper sends the email later
+        :rtype: bool
+        """
+        if self.queue is None or self.closing or email_id in self.queued:
+            return False
+        self.queued.add(email_id)
+        await self.queue.put(email_id)
+        return True
+
+    def _smtp(self) -> aiosmtplib.SMTP:
+        credentials = {"username": self.config.MAIL_USERNAME,
+                       "password": self.config.MAIL_PASSWORD} if self.config.USE_CREDENTIALS else {}
+        return aiosmtplib.SMTP(hostname=self.config.MAIL_SERVER, port=self.config.MAIL_PORT,
+                               use_tls=self.config.MAIL_SSL_TLS, start_tls=self.config.MAIL_STARTTLS,
+                               validate_certs=self.config.VALIDATE_CERTS, timeout=self.config.TIMEOUT,
+                               **credentials)
+
+    async def render(self, email: OutboxEmail) -> Message:
+        """
+        Build the MIME message of a stored email
+
+        :param email: email from the outbox
+        :type email: OutboxEmail
+        :return: message ready to send
+        :rtype: Message
+        """
+        template = self.templates.get_template(email.template)
+        message = MessageSchema(subject=email.subject, recipients=[email.recipient],
+                                body=template.render(**json.loads(email.template_body)), subtype=MessageType.html)
+        return await MailMsg(message)._message(self.sender)
+
+    @staticmethod
+    async def _send(smtp: aiosmtplib.SMTP, message: Message) -> None:
+        if not smtp.is_connected:
+            await smtp.connect()
+        try:
+            await smtp.send_message(message)
+        except aiosmtplib.SMTPServerDisconnected:
+            # the server dropped the idle connection, reconnect once
+            await smtp.connect()
+            await smtp.send_message(message)
+
+    async def deliver(self, ids: list[int], smtp: aiosmtplib.SMTP) -> None:
+        """
+        Send a batch of stored emails over one connection
+
+        :param ids: ids of emails in the outbox
+        :type ids: list[int]
+        :param smtp: connection of the worker
+        :type smtp: aiosmtplib.SMTP
+        :return: None
+        :rtype: None
+        """
+        async with self.session_factory() as db:
+            emails = await repository_outbox.claim(ids, self.lease, db)
+            for email in emails:
+                try:
+                    await self._send(smtp, await self.render(email))
+                except Exception as err:
+                    # a bad row fails alone, the rest of the batch still goes out
+                    print(err)
+                    if isinstance(err, (aiosmtplib.SMTPException, OSError)) and smtp.is_connected:
+                        smtp.close()
+                    await repository_outbox.mark_failed(email.id, str(err), self.retry_delay * 2 ** email.attempts, db)
+                    continue
+                # record every send at once, a later failure must not send it again
+                await repository_outbox.mark_sent([email.id], db)
+
+    async def _next_batch(self) -> list[int]:
+        ids = [await self.queue.get()]
+        # stop draining once closing, so every idle worker still gets its wake-up None
+        while len(ids) < self.batch_size and not self.queue.empty() and not self.closing:
+            ids.append(self.queue.get_nowait())
+        self.queued.difference_update(ids)
+        return [email_id for email_id in ids if email_id is not None]
+
+    async def _worker(self) -> None:
+        smtp = self._smtp()
+        try:
+            while not self.closing:
+                ids = await self._next_batch()
+                if not ids:
+                    continue
+                try:
+                    await self.deliver(ids, smtp)
+                except Exception as err:
+                    # the emails stay due in the outbox and come back with the sweeper,
+                    # the worker keeps running whatever went wrong
+                    print(err)
+        finally:
+            if smtp.is_connected:
+                smtp.close()
+
+    async def _sweeper(self) -> None:
+        while True:
+            free = self.queue_size - self.queue.qsize()
+            if free > 0:
+                try:
+                    async with self.session_factory() as db:
+                        ids = await repository_outbox.due_ids(free, self.max_attempts, db)
+                    for email_id in ids:
+                        self.submit(email_id)
+                except Exception as err:
+                    # e.g. the db is unreachable, due emails stay in the outbox for the next sweep
+                    print(err)
+            await asyncio.sleep(self.sweep_interval)
+
+
+mail_dispatcher = MailDispatcher(
+    conf,
+    DBSession,
+    connections=settings.mail_connections,
+    queue_size=settings.mail_queue_size,
+    batch_size=settings.mail_batch_size,
+    max_attempts=settings.mail_max_attempts,
+    retry_delay=settings.mail_retry_delay,
+    sweep_interval=settings.mail_sweep_interval,
+)
+
+
+async def send_email(email: EmailStr, username: str, host: str, db: AsyncSession):
+    """
+    Store a confirmation email in the outbox and hand it to the mail dispatcher
 
     :param email: email to send
     :type email: EmailStr
@@ -32,19 +247,14 @@ async def send_email(email: EmailStr, username: str, host: str):
     :type username: str
     :param host: host for email
     :type host: str
+    :param db: current session to db
+    :type db: AsyncSession
     :return: None
     :rtype: None
     """
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
\ No newline at end of file
+    token_verification = auth_service.create_email_token({"sub": email})
+    outbox_email = await repository_outbox.enqueue(
+        email, "Confirm your email ", "email_template.html",
+        {"host": str(host), "username": username, "token": token_verification}, db
+    )
+    mail_dispatcher.submit(outbox_email.id)
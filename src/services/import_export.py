@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterator, BinaryIO, Iterator
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncResult
+
+from src.database.models import User
+from src.repository import contacts as repository_contact
+from src.schemas import ContactModel
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+EXPORT_MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def _records(file: BinaryIO, fmt: str) -> Iterator[dict | str]:
+    """
+    Raw records of an uploaded file, a dict per row or an error message for a broken line
+
+    :param file: uploaded file
+    :type file: BinaryIO
+    :param fmt: csv or ndjson
+    :type fmt: str
+    :return: rows one by one
+    :rtype: Iterator
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        yield from csv.DictReader(text)
+        return
+    for line in text:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as err:
+            yield f'invalid json: {err}'
+            continue
+        yield record if isinstance(record, dict) else 'row is not a json object'
+
+
+def _validate(record: dict | str) -> tuple[ContactModel | None, list[str]]:
+    """
+    Validate one raw record with ContactModel
+
+    :param record: raw record
+    :type record: dict | str
+    :return: contact or None with the list of problems
+    :rtype: tuple
+    """
+    if isinstance(record, str):
+        return None, [record]
+    if None in record:
+        return None, ['too many fields']
+    try:
+        return ContactModel(**record), []
+    except ValidationError as err:
+        return None, [f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in err.errors()]
+
+
+def _next_batch(records: Iterator[dict | str]) -> list[tuple[ContactModel | None, list[str]]]:
+    """
+    Read and validate the next batch of records, runs in a worker thread
+
+    :param records: raw records
+    :type records: Iterator
+    :return: validated rows of the batch
+    :rtype: list
+    """
+    return [_validate(record) for record in islice(records, IMPORT_BATCH_SIZE)]
+
+
+async def import_contacts(file: BinaryIO, fmt: str, user: User, db: AsyncSession) -> dict:
+    """
+    Stream an uploaded csv or ndjson file into contacts.
+    Batches are read and validated off the event loop, every batch is inserted with one executemany
+
+    :param file: uploaded file
+    :type file: BinaryIO
+    :param fmt: csv or ndjson
+    :type fmt: str
+    :param user: current user - contact owner
+    :type user: User
+    :param db: current session to db
+    :type db: AsyncSession
+    :return: counts of imported, duplicate and failed rows and the first row errors
+    :rtype: dict
+    """
+    report = {"imported": 0, "duplicates": 0, "failed": 0, "errors": []}
+    records = _records(file, fmt)
+    row = 0
+    while batch := await run_in_threadpool(_next_batch, records):
+        bodies = []
+        for body, errors in batch:
+            row += 1
+            if body is None:
+                report["failed"] += 1
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append({"row": row, "errors": errors})
+            else:
+                bodies.append(body)
+        imported = await repository_contact.create_many(bodies, user, db)
+        report["imported"] += imported
+        report["duplicates"] += len(bodies) - imported
+    return report
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+async def export_rows(result: AsyncResult, fmt: str) -> AsyncIterator[str]:
+    """
+    Encode streamed rows as ndjson or csv, one chunk per fetched partition,
+    so memory stays flat and the first bytes go out before the query is finished
+
+    :param result: streamed rows from the repository
+    :type result: AsyncResult
+    :param fmt: csv or ndjson
+    :type fmt: str
+    :return: encoded chunks
+    :rtype: AsyncIterator
+    """
+    fields = list(result.keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(fields)
+    async for partition in result.partitions():
+        for row in partition:
+            if fmt == 'csv':
+                writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+            else:
+                buffer.write(json.dumps(dict(zip(fields, row)), default=_json_default) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,258 @@
+import asyncio
+import time
+from math import ceil
+
+from fastapi import Depends, HTTPException, Request, status
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.connector import redis_db
+from src.database.models import User
+from src.services.auth import auth_service
+
+# sliding window counter: the previous fixed window is weighted by the part of it still inside the sliding window
+# local requests not synced yet are flushed first (ARGV[4], ARGV[5]), so the decision sees every request
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local elapsed = tonumber(ARGV[3])
+local current, previous
+if tonumber(ARGV[4]) > 0 then
+    current = redis.call('INCRBY', KEYS[1], ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], window * 2)
+else
+    current = tonumber(redis.call('GET', KEYS[1]) or '0')
+end
+if tonumber(ARGV[5]) > 0 then
+    previous = redis.call('INCRBY', KEYS[2], ARGV[5])
+    redis.call('PEXPIRE', KEYS[2], window)
+else
+    previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+end
+local weighted = previous * (window - elapsed) / window + current
+if weighted + 1 > limit then
+    local wait = window - elapsed
+    if previous > 0 and current < limit then
+        wait = math.min(wait, math.ceil((weighted + 1 - limit) * window / previous))
+    end
+    return {math.max(wait, 1), current, previous}
+end
+current = redis.call('INCR', KEYS[1])
+redis.call('PEXPIRE', KEYS[1], window * 2)
+return {0, current, previous}
+"""
+
+
+class LocalBucket:
+    """
+    Requests of one user on one route as seen by this worker: window counts from the last sync with redis
+    plus local requests not flushed yet
+    """
+
+    def __init__(self, times: int, window: int):
+        self.times = times
+        self.window = window
+        self.synced = {}
+        self.pending = {}
+        self.last_hit = 0
+
+    def count(self, index: int) -> int:
+        return self.synced.get(index, 0) + self.pending.get(index, 0)
+
+    def weighted(self, now_ms: int, count=None) -> float:
+        """
+        Requests inside the sliding window ending now
+
+        :param now_ms: current time in milliseconds
+        :type now_ms: int
+        :param count: count of a window by its index, synced plus pending by default
+        :type count: Callable[[int], int] | None
+        :return: estimated count of all workers
+        :rtype: float
+        """
+        count = count or self.count
+        index, elapsed = divmod(now_ms, self.window)
+        return count(index - 1) * (self.window - elapsed) / self.window + count(index)
+
+    def idle(self, now_ms: int) -> bool:
+        """
+        Nothing to flush and nothing to remember: all windows are empty or the user is gone for two windows
+
+        :param now_ms: current time in milliseconds
+        :type now_ms: int
+        :return: True if the bucket can be dropped, a new one loads the counts again
+        :rtype: bool
+        """
+        if self.pending:
+            return False
+        return not any(self.synced.values()) or now_ms - self.last_hit >= 2 * self.window
+
+    def forget_before(self, index: int) -> None:
+        for counts in (self.synced, self.pending):
+            for old in [i for i in counts if i < index]:
+                del counts[old]
+
+
+class RateLimits:
+    """
+    Per-user sliding window limits counted in process.
+    Requests well under the limit are decided locally and flushed to redis by a background sync,
+    which also brings back the counts of other workers. Every worker decides locally only its part
+    of the room left under local_share of the limit, so all workers together stay under it between syncs.
+    Close to the limit every request goes through one atomic Lua call in redis,
+    so the limit stays exact where it matters
+    """
+
+    def __init__(self, redis_db, local_share: float = 0.8, sync_interval: float = 1.0, workers: int = 1,
+                 prefix: str = 'rate'):
+        self.redis_db = redis_db
+        self.local_share = local_share
+        self.workers = workers
+        self.sync_interval = sync_interval
+        self.prefix = prefix
+        self.buckets = {}
+        self.script = redis_db.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def key(self, name: str, index: int) -> str:
+        return f'{self.prefix}:{name}:{index}'
+
+    async def hit(self, name: str, times: int, window: int) -> int:
+        """
+        Count a request
+
+        :param name: route and user
+        :type name: str
+        :param times: requests allowed in the window
+        :type times: int
+        :param window: window in milliseconds
+        :type window: int
+        :return: 0 if allowed, otherwise milliseconds to wait
+        :rtype: int
+        """
+        now_ms = int(time.time() * 1000)
+        index, elapsed = divmod(now_ms, window)
+        bucket = self.buckets.get(name)
+        if bucket is None:
+            bucket = self.buckets[name] = LocalBucket(times, window)
+            await self.load(name, bucket, index)
+        bucket.last_hit = now_ms
+        room = (times * self.local_share - bucket.weighted(now_ms, lambda i: bucket.synced.get(i, 0))) / self.workers
+        if bucket.weighted(now_ms, lambda i: bucket.pending.get(i, 0)) + 1 <= room:
+            bucket.pending[index] = bucket.pending.get(index, 0) + 1
+            return 0
+        pending_current = bucket.pending.pop(index, 0)
+        pending_previous = bucket.pending.pop(index - 1, 0)
+        try:
+            wait, current, previous = await self.script(
+                keys=[self.key(name, index), self.key(name, index - 1)],
+                args=[times, window, elapsed, pending_current, pending_previous], client=self.redis_db
+            )
+        except RedisError as err:
+            # redis is away, keep limiting on the local estimate
+            print(err)
+            bucket.pending[index] = bucket.pending.get(index, 0) + pending_current
+            bucket.pending[index - 1] = bucket.pending.get(index - 1, 0) + pending_previous
+            if bucket.weighted(now_ms) + 1 > times:
+                return window - elapsed
+            bucket.pending[index] += 1
+            return 0
+        bucket.synced[index] = current
+        bucket.synced[index - 1] = previous
+        return wait
+
+    async def load(self, name: str, bucket: LocalBucket, index: int) -> None:
+        """
+        Start a new bucket from the counts other workers already flushed
+
+        :param name: route and user
+        :type name: str
+        :param bucket: new bucket
+        :type bucket: LocalBucket
+        :param index: current window
+        :type index: int
+        :return: None
+        :rtype: None
+        """
+        try:
+            current, previous = await self.redis_db.mget(self.key(name, index), self.key(name, index - 1))
+        except RedisError as err:
+            print(err)
+            return
+        bucket.synced = {index: int(current or 0), index - 1: int(previous or 0)}
+
+    async def sync(self) -> None:
+        """
+        Flush local counts to redis and load the counts of all workers
+
+        :return: None
+        :rtype: None
+        """
+        now_index = {}
+        flushed = []
+        pipe = self.redis_db.pipeline(transaction=False)
+        now_ms = int(time.time() * 1000)
+        for name, bucket in list(self.buckets.items()):
+            index = now_ms // bucket.window
+            bucket.forget_before(index - 1)
+            if bucket.idle(now_ms):
+                del self.buckets[name]
+                continue
+            pending, bucket.pending = bucket.pending, {}
+            flushed.append((bucket, pending))
+            for i, count in pending.items():
+                pipe.incrby(self.key(name, i), count)
+                pipe.pexpire(self.key(name, i), bucket.window * 2)
+            pipe.get(self.key(name, index))
+            pipe.get(self.key(name, index - 1))
+            now_index[name] = (bucket, index, 2 * len(pending))
+        if not now_index:
+            return
+        try:
+            results = await pipe.execute()
+        except RedisError:
+            # put the counts back for the next sync
+            for bucket, pending in flushed:
+                for i, count in pending.items():
+                    bucket.pending[i] = bucket.pending.get(i, 0) + count
+            raise
+        position = 0
+        for bucket, index, writes in now_index.values():
+            current, previous = results[position + writes:position + writes + 2]
+            bucket.synced = {index: int(current or 0), index - 1: int(previous or 0)}
+            position += writes + 2
+
+    async def run(self) -> None:
+        """
+        Sync every sync_interval seconds until cancelled
+
+        :return: None
+        :rtype: None
+        """
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except RedisError as err:
+                print(err)
+
+
+rate_limits = RateLimits(redis_db, local_share=settings.rate_limit_local_share,
+                         sync_interval=settings.rate_limit_sync_interval, workers=settings.rate_limit_workers)
+
+
+class RateLimiter:
+    """
+    Route dependency limiting the current user to times requests per seconds
+    """
+
+    def __init__(self, times: int, seconds: int):
+        self.times = times
+        self.window = seconds * 1000
+
+    async def __call__(self, request: Request, cur_user: User = Depends(auth_service.get_current_user)):
+        endpoint = request.scope['endpoint']
+        name = f'{endpoint.__module__}.{endpoint.__name__}:{cur_user.id}'
+        wait = await rate_limits.hit(name, self.times, self.window)
+        if wait:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers={"Retry-After": str(ceil(wait / 1000))})
@@ -0,0 +1,81 @@
+import hashlib
+
+from src.conf.config import settings
+from src.database.connector import redis_db
+
+# swap the stored digest only if it still matches the presented token,
+# otherwise the token was reused or revoked and the session is dropped
+ROTATE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+redis.call('DEL', KEYS[1])
+return 0
+"""
+
+
+class RefreshTokens:
+    """
+    Current refresh token of every user in redis under refresh:{email}.
+    Only a digest of the token is stored, the key expires together with the token
+    """
+
+    def __init__(self, redis_db, ttl: int):
+        self.redis_db = redis_db
+        self.ttl = ttl
+        self.rotate_script = redis_db.register_script(ROTATE_SCRIPT)
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f'refresh:{email}'
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    async def issue(self, email: str, token: str) -> None:
+        """
+        Store a new refresh token after login, the previous one stops working
+
+        :param email: user's email
+        :type email: str
+        :param token: refresh token
+        :type token: str
+        :return: None
+        :rtype: None
+        """
+        await self.redis_db.set(self.key(email), self.digest(token), ex=self.ttl)
+
+    async def rotate(self, email: str, token: str, new_token: str) -> bool:
+        """
+        Replace the presented token with a new one in one round trip.
+        A token that is not the current one revokes the session
+
+        :param email: user's email
+        :type email: str
+        :param token: presented refresh token
+        :type token: str
+        :param new_token: refresh token to store
+        :type new_token: str
+        :return: True if the presented token was the current one
+        :rtype: bool
+        """
+        rotated = await self.rotate_script(keys=[self.key(email)],
+                                           args=[self.digest(token), self.digest(new_token), self.ttl],
+                                           client=self.redis_db)
+        return rotated == 1
+
+    async def revoke(self, email: str) -> None:
+        """
+        Drop the refresh token of the user
+
+        :param email: user's email
+        :type email: str
+        :return: None
+        :rtype: None
+        """
+        await self.redis_db.delete(self.key(email))
+
+
+refresh_tokens = RefreshTokens(redis_db, ttl=settings.refresh_token_ttl)
@@ -0,0 +1,202 @@
+import time
+from typing import NamedTuple
+from urllib.parse import urlencode
+
+import orjson
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from redis.exceptions import RedisError
+from sqlalchemy import Row
+
+from src.conf.config import settings
+from src.database.connector import redis_db
+from src.database.models import User
+from src.services.conditional import etag_matches
+
+# a missing version starts at the current time in milliseconds, so after a flush or failover
+# versions keep growing past the ones clients already hold instead of counting from zero again
+VERSION_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'NX')
+return redis.call('GET', KEYS[1])
+"""
+
+BUMP_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'NX')
+return redis.call('INCR', KEYS[1])
+"""
+
+# read the data version of the user and the response cached for it in one round trip
+LOOKUP_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[3], 'NX')
+local version = redis.call('GET', KEYS[1])
+return {version, redis.call('GET', ARGV[1] .. version .. ARGV[2])}
+"""
+
+
+def row_to_dict(row: Row) -> dict:
+    if isinstance(row, Row):
+        return row._asdict()
+    raise TypeError
+
+
+class CacheSlot(NamedTuple):
+    """
+    Where put stores a response and the entity tag it is sent with
+    """
+    key: str
+    etag: str
+
+
+class ResponseCache:
+    """
+    Serialized responses of read routes under cache:{user_id}:{version}:{path}?{query}.
+    Repositories bump the data version of the user after every change, so one INCR makes all
+    cached responses of the user unreachable, they expire after ttl.
+    The version is also the weak ETag of the responses, so polling clients get 304 after one GET.
+    Versions never repeat: a lost version key starts again from the current time in milliseconds
+    """
+
+    def __init__(self, redis_db, ttl: int = 300):
+        self.redis_db = redis_db
+        self.ttl = ttl
+        self.version_script = redis_db.register_script(VERSION_SCRIPT)
+        self.bump_script = redis_db.register_script(BUMP_SCRIPT)
+        self.lookup_script = redis_db.register_script(LOOKUP_SCRIPT)
+
+    @staticmethod
+    def prefix(user_id: int) -> str:
+        # the hash tag keeps the version and the responses of one user in one cluster slot
+        return f'cache:{{{user_id}}}:'
+
+    def version_key(self, user_id: int) -> str:
+        return f'{self.prefix(user_id)}version'
+
+    @staticmethod
+    def etag(user_id: int, version: int) -> str:
+        return f'W/"{user_id}-{version}"'
+
+    @staticmethod
+    def seed() -> int:
+        return int(time.time() * 1000)
+
+    @staticmethod
+    def route(request: Request) -> str:
+        return f'{request.url.path}?{urlencode(sorted(request.query_params.multi_items()))}'
+
+    async def version(self, user_id: int) -> int:
+        """
+        Current data version of the user
+
+        :param user_id: user's id
+        :type user_id: int
+        :return: version
+        :rtype: int
+        """
+        return int(await self.version_script(keys=[self.version_key(user_id)], args=[self.seed()],
+                                             client=self.redis_db))
+
+    async def bump(self, user_id: int) -> None:
+        """
+        Invalidate all cached responses of the user after a change in db
+
+        :param user_id: user's id
+        :type user_id: int
+        :return: None
+        :rtype: None
+        """
+        try:
+            await self.bump_script(keys=[self.version_key(user_id)], args=[self.seed()], client=self.redis_db)
+        except RedisError as err:
+            print(err)
+
+    async def get(self, request: Request, user: User) -> tuple[CacheSlot | None, Response | None]:
+        """
+        Cached response of the route for the current data version of the user,
+        or 304 when If-None-Match carries the current version
+
+        :param request: incoming request
+        :type request: Request
+        :param user: current user
+        :type user: User
+        :return: slot to store the response in, None when redis is away, and the response to send or None
+        :rtype: tuple[CacheSlot | None, Response | None]
+        """
+        prefix, route = self.prefix(user.id), f':{self.route(request)}'
+        try:
+            if_none_match = request.headers.get('if-none-match')
+            if if_none_match:
+                # only the version is needed to answer a revalidation
+                etag = self.etag(user.id, await self.version(user.id))
+                if etag_matches(etag, if_none_match):
+                    return None, Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            version, data = await self.lookup_script(keys=[self.version_key(user.id)],
+                                                     args=[prefix, route, self.seed()], client=self.redis_db)
+        except RedisError as err:
+            print(err)
+            return None, None
+        slot = CacheSlot(f'{prefix}{int(version)}{route}', self.etag(user.id, int(version)))
+        if data is None:
+            return slot, None
+        headers, body = data.split(b'\n', 1)
+        return slot, Response(content=body, media_type='application/json', headers=orjson.loads(headers))
+
+    async def put(self, slot: CacheSlot | None, model, content, headers: dict | None = None) -> Response:
+        """
+        Serialize the result of the route through its response model and cache it
+
+        :param slot: slot from get
+        :type slot: CacheSlot | None
+        :param model: response model of the route
+        :type model: type
+        :param content: orm objects to return
+        :type content: Any
+        :param headers: extra response headers
+        :type headers: dict | None
+        :return: json response
+        :rtype: Response
+        """
+        return await self.store(slot, orjson.dumps(jsonable_encoder(parse_obj_as(model, content))), headers)
+
+    async def put_rows(self, slot: CacheSlot | None, rows: list, headers: dict | None = None) -> Response:
+        """
+        Encode db rows straight with orjson and cache them.
+        The fast path for lists: rows come from trusted queries already shaped like the response model,
+        so there is no validation and no orm objects
+
+        :param slot: slot from get
+        :type slot: CacheSlot | None
+        :param rows: rows with the fields of the response model
+        :type rows: list
+        :param headers: extra response headers
+        :type headers: dict | None
+        :return: json response
+        :rtype: Response
+        """
+        return await self.store(slot, orjson.dumps(rows, default=row_to_dict), headers)
+
+    async def store(self, slot: CacheSlot | None, body: bytes, headers: dict | None = None) -> Response:
+        """
+        Cache an encoded body with its headers
+
+        :param slot: slot from get
+        :type slot: CacheSlot | None
+        :param body: json body
+        :type body: bytes
+        :param headers: extra response headers
+        :type headers: dict | None
+        :return: json response
+        :rtype: Response
+        """
+        headers = dict(headers or {})
+        if slot is not None:
+            headers['ETag'] = slot.etag
+            try:
+                # orjson output has no newlines, so the headers go on the first line
+                await self.redis_db.set(slot.key, orjson.dumps(headers) + b'\n' + body, ex=self.ttl)
+            except RedisError as err:
+                print(err)
+        return Response(content=body, media_type='application/json', headers=headers)
+
+
+response_cache = ResponseCache(redis_db, ttl=settings.response_cache_ttl)
@@ -0,0 +1,81 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from src.conf.config import settings
+
+
+class TokenCache:
+    """
+    Access tokens that already passed signature verification, keyed by their sha256 digest.
+    Entries expire together with the token, least recently used are evicted
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> str | None:
+        """
+        Subject of a verified token that has not expired yet
+
+        :param token: access token
+        :type token: str
+        :return: email or None when the token has to be decoded
+        :rtype: str | None
+        """
+        key = self.digest(token)
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, email = entry
+            if expires_at > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return email
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, token: str, email: str, expires_at: float) -> None:
+        """
+        Remember a verified token until its exp
+
+        :param token: access token
+        :type token: str
+        :param email: subject of the token
+        :type email: str
+        :param expires_at: exp claim, unix time
+        :type expires_at: float
+        :return: None
+        :rtype: None
+        """
+        key = self.digest(token)
+        self.entries[key] = (expires_at, email)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def snapshot(self) -> dict:
+        """
+        Hit and miss counters of the current worker
+
+        :return: token cache statistics
+        :rtype: dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+token_cache = TokenCache(max_size=settings.token_cache_size)
@@ -0,0 +1,192 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import orjson
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.connector import redis_db
+from src.database.models import User
+
+USER_CACHE_VERSION = 1
+
+
+def encode_user(user: User) -> bytes:
+    """
+    Pack the user fields needed by authenticated routes, without password and tokens
+
+    :param user: user from db
+    :type user: User
+    :return: versioned json array
+    :rtype: bytes
+    """
+    return orjson.dumps([USER_CACHE_VERSION, user.id, user.name, user.email, user.confirmed, user.created_at,
+                         user.avatar])
+
+
+def decode_user(data: bytes) -> User | None:
+    """
+    Unpack a user made by encode_user
+
+    :param data: cached value
+    :type data: bytes
+    :return: detached user or None for a value in another format
+    :rtype: User | None
+    """
+    try:
+        version, *fields = orjson.loads(data)
+    except (orjson.JSONDecodeError, TypeError, ValueError):
+        return None
+    if version != USER_CACHE_VERSION:
+        return None
+    user_id, name, email, confirmed, created_at, avatar = fields
+    return User(id=user_id, name=name, email=email, confirmed=confirmed, avatar=avatar,
+                created_at=datetime.fromisoformat(created_at) if created_at else None)
+
+
+class LocalTier:
+    """
+    Bounded in-process LRU of encoded users with a short ttl
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, email: str) -> bytes | None:
+        entry = self.entries.get(email)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at < time.monotonic():
+            del self.entries[email]
+            return None
+        self.entries.move_to_end(email)
+        return data
+
+    def put(self, email: str, data: bytes) -> None:
+        self.entries[email] = (time.monotonic() + self.ttl, data)
+        self.entries.move_to_end(email)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, email: str) -> None:
+        self.entries.pop(email, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+class UserCache:
+    """
+    Authenticated users in two tiers: a per-worker LocalTier in front of redis under user:{email}.
+    Invalidations are published on a redis channel so every worker drops its local copy.
+    Without redis the cache only misses, users come from db and the local ttl bounds staleness
+    """
+
+    CHANNEL = 'user-cache:invalidate'
+
+    def __init__(self, redis_db, ttl: int = 900, local_size: int = 4096, local_ttl: float = 60):
+        self.redis_db = redis_db
+        self.ttl = ttl
+        self.local = LocalTier(local_size, local_ttl)
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f'user:{email}'
+
+    async def get(self, email: str) -> User | None:
+        """
+        Cached user by email, from this worker's memory when possible
+
+        :param email: user's email
+        :type email: str
+        :return: User | None
+        :rtype: User | None
+        """
+        data = self.local.get(email)
+        if data is None:
+            try:
+                data = await self.redis_db.get(self.key(email))
+            except RedisError as err:
+                print(err)
+                return None
+            if data is None:
+                return None
+            self.local.put(email, data)
+        return decode_user(data)
+
+    async def set(self, user: User) -> None:
+        """
+        Cache the user in both tiers
+
+        :param user: user from db
+        :type user: User
+        :return: None
+        :rtype: None
+        """
+        data = encode_user(user)
+        try:
+            await self.redis_db.set(self.key(user.email), data, ex=self.ttl)
+        except RedisError as err:
+            print(err)
+        self.local.put(user.email, data)
+
+    async def invalidate(self, email: str) -> None:
+        """
+        Drop the cached user after a change in db, here and in every other worker
+
+        :param email: user's email
+        :type email: str
+        :return: None
+        :rtype: None
+        """
+        self.local.pop(email)
+        try:
+            await self.redis_db.delete(self.key(email))
+            await self.redis_db.publish(self.CHANNEL, email)
+        except RedisError as err:
+            # the change is committed already, other workers catch up after their local ttl
+            print(err)
+
+    def on_message(self, message: dict) -> None:
+        """
+        Apply one pub/sub message
+
+        :param message: message from redis pub/sub
+        :type message: dict
+        :return: None
+        :rtype: None
+        """
+        if message['type'] == 'message':
+            data = message['data']
+            self.local.pop(data.decode() if isinstance(data, bytes) else data)
+
+    async def listen(self) -> None:
+        """
+        Follow invalidations of other workers until cancelled.
+        The local tier is cleared whenever the subscription is (re)established, as messages may have been missed
+
+        :return: None
+        :rtype: None
+        """
+        while True:
+            try:
+                pubsub = self.redis_db.pubsub()
+                try:
+                    await pubsub.subscribe(self.CHANNEL)
+                    self.local.clear()
+                    async for message in pubsub.listen():
+                        self.on_message(message)
+                finally:
+                    await pubsub.reset()
+            except RedisError as err:
+                print(err)
+                self.local.clear()
+                await asyncio.sleep(1)
+
+
+user_cache = UserCache(redis_db, local_size=settings.user_cache_local_size, local_ttl=settings.user_cache_local_ttl)
@@ -1,23 +1,37 @@
 
 import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
 
 from fastapi.testclient import TestClient
-from fastapi_limiter.depends import RateLimiter
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from main import app
 from src.database.models import Base
 from src.database.connector import get_db
 from src.services.auth import auth_service
+from src.services.autocomplete import autocomplete
+from src.services.user_cache import user_cache
+from src.services.token_cache import token_cache
+from src.services.rate_limit import RateLimiter, rate_limits
+from src.services.refresh_tokens import refresh_tokens
+from src.services.response_cache import response_cache
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# TestClient runs every request in its own event loop, so the app side does not pool connections
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 
 @pytest.fixture(scope="module")
 def session():
@@ -25,6 +39,9 @@ def session():
 
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    autocomplete.indexes.clear()
+    user_cache.local.clear()
+    token_cache.entries.clear()
 
     db = TestingSessionLocal()
     try:
@@ -37,11 +54,12 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
+    async def override_get_db():
+        db = AsyncTestingSessionLocal()
         try:
-            yield session
+            yield db
         finally:
-            session.close()
+            await db.close()
 
     app.dependency_overrides[get_db] = override_get_db
 
@@ -59,3 +77,23 @@ def mock_rate_limit(mocker):
     mock_rate_limit.return_value = False
 
 
+class FakeRedisPerCall:
+    """
+    TestClient runs every request in its own event loop, so each call gets a fresh client of one fake server
+    """
+
+    def __init__(self):
+        self.server = FakeServer()
+
+    def __getattr__(self, name):
+        return getattr(FakeRedis(server=self.server), name)
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    fake_redis = FakeRedisPerCall()
+    monkeypatch.setattr(refresh_tokens, 'redis_db', fake_redis)
+    monkeypatch.setattr(rate_limits, 'redis_db', fake_redis)
+    monkeypatch.setattr(rate_limits, 'buckets', {})
+    monkeypatch.setattr(response_cache, 'redis_db', fake_redis)
+    return fake_redis
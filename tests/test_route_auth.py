@@ -1,10 +1,14 @@
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, patch
 
-from src.database.models import User
+from passlib.hash import bcrypt
+
+from src.conf.config import settings
+from src.database.models import User, OutboxEmail
+from src.services.user_cache import user_cache
 
 
 def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = AsyncMock()
     monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
     response = client.post(
         "/api/auth/signup",
@@ -16,6 +20,18 @@ def test_create_user(client, user, monkeypatch):
     assert "id" in data["user"]
 
 
+def test_signup_stores_email_in_outbox(client, session):
+    response = client.post(
+        "/api/auth/signup",
+        json={"name": "wolverine", "email": "wolverine@example.com", "password": "12345678"},
+    )
+    assert response.status_code == 201, response.text
+    email = session.query(OutboxEmail).filter(OutboxEmail.recipient == "wolverine@example.com").one()
+    assert email.sent_at is None
+    assert email.attempts == 0
+    assert "wolverine" in email.template_body
+
+
 def test_repeat_create_user(client, user):
     response = client.post(
         "/api/auth/signup",
@@ -49,6 +65,29 @@ def test_login_user(client, session, user):
     assert data["token_type"] == "bearer"
 
 
+def test_login_rehashes_password(client, session, user):
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.password = bcrypt.using(rounds=4).hash(user.get('password'))
+    session.commit()
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    session.refresh(current_user)
+    assert current_user.password.startswith(f"$2b${settings.bcrypt_rounds:02d}$")
+
+
+def test_login_too_many_pending(client, user, monkeypatch):
+    monkeypatch.setattr(settings, "hash_max_pending", 0)
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 503, response.text
+    assert response.headers["Retry-After"] == "1"
+
+
 def test_login_wrong_password(client, user):
     response = client.post(
         "/api/auth/login",
@@ -67,3 +106,36 @@ def test_login_wrong_email(client, user):
     assert response.status_code == 401, response.text
     data = response.json()
     assert data["detail"] == "Invalid email"
+
+
+def test_refresh_token(client, user):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    old_refresh_token = response.json()["refresh_token"]
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {old_refresh_token}"})
+    assert response.status_code == 200, response.text
+    new_refresh_token = response.json()["refresh_token"]
+    assert new_refresh_token != old_refresh_token
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {old_refresh_token}"})
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Invalid refresh token"
+    # reuse of a rotated token revokes the session
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {new_refresh_token}"})
+    assert response.status_code == 401, response.text
+
+
+def test_logout_revokes_refresh_token(client, user):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    tokens = response.json()
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.post("/api/auth/logout", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert response.status_code == 204, response.text
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Invalid refresh token"
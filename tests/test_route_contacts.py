@@ -1,15 +1,18 @@
-from unittest.mock import MagicMock, patch
+import json
+from unittest.mock import AsyncMock, patch
 
 from pytest import mark, fixture
 
+from src.conf.config import settings
 from src.database.models import User
-from src.services.auth import auth_service
+from src.repository import contacts as repository_contact
+from src.services.user_cache import user_cache
 from fastapi import status
 
 
 @fixture(scope='function')
 def token(client, user, session, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = AsyncMock()
     monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
     client.post("/api/auth/signup", json=user)
     current_user: User = session.query(User).filter(User.email == user.get('email')).first()
@@ -25,7 +28,7 @@ def token(client, user, session, monkeypatch):
 
 @mark.usefixtures('mock_rate_limit')
 def test_create_contact(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.post(
             "/api/contacts",
@@ -44,7 +47,7 @@ def test_create_contact(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_get_contacts_without_token(client):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.post(
             "/api/contacts",
@@ -55,7 +58,7 @@ def test_get_contacts_without_token(client):
 
 @mark.usefixtures('mock_rate_limit')
 def test_get_contacts_with_token(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
             "/api/contacts",
@@ -64,9 +67,87 @@ def test_get_contacts_with_token(client, token):
         assert response.status_code == status.HTTP_200_OK
 
 
+@mark.usefixtures('mock_rate_limit')
+def test_get_contacts_cursor(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/contacts", params={"limit": 1}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 1
+        cursor = response.headers["X-Next-Cursor"]
+        response = client.get("/api/contacts", params={"limit": 1, "after": cursor},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == []
+        assert "X-Next-Cursor" not in response.headers
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_get_contacts_bad_cursor(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/contacts", params={"after": "kuku"}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["detail"] == "Invalid cursor"
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_get_contacts_fast(client, token, monkeypatch):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        expected = client.get("/api/contacts", params={"limit": 1}, headers={"Authorization": f"Bearer {token}"})
+        monkeypatch.setattr(settings, 'fast_list_responses', True)
+        # another query, so the response is not served from the cache
+        response = client.get("/api/contacts", params={"limit": 1, "skip": 0},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == expected.json()
+        assert response.headers["X-Next-Cursor"] == expected.headers["X-Next-Cursor"]
+
+
+def test_get_contacts_rate_limit(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        for _ in range(10):
+            response = client.get("/api/contacts", headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == status.HTTP_200_OK
+        response = client.get("/api/contacts", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(response.headers["Retry-After"]) > 0
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_search(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        for q in ("Dow", "exampel", "287706", "jo"):
+            response = client.get("/api/contacts/search", params={"q": q}, headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == status.HTTP_200_OK, q
+            assert [contact["email"] for contact in response.json()] == ["user@example.com"], q
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_search_not_found(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/contacts/search", params={"q": "zzzz"}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == []
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_autocomplete(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/contacts/autocomplete", params={"q": "do"},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == [{"id": 1, "first_name": "John", "last_name": "Dow"}]
+
+
 @mark.usefixtures('mock_rate_limit')
 def test_get_one(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.get("/api/contacts/1", headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_200_OK
@@ -79,7 +160,7 @@ def test_get_one(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_get_one_error(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.get("/api/contacts/100", headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -90,7 +171,7 @@ def test_get_one_error(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_find_by_name(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.get('/api/contacts/find/name/John', headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_200_OK
@@ -102,7 +183,7 @@ def test_find_by_name(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_find_by_name_error(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.get('/api/contacts/find/name/Joe', headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -112,7 +193,7 @@ def test_find_by_name_error(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_find_by_lastname(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.get('/api/contacts/find/lastname/Dow', headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_200_OK
@@ -122,7 +203,7 @@ def test_find_by_lastname(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_find_by_lastname_error(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.get('/api/contacts/find/lastname/TEST', headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -132,7 +213,7 @@ def test_find_by_lastname_error(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_find_by_email(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.get('/api/contacts/find/email/user@example.com', headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_200_OK
@@ -142,7 +223,7 @@ def test_find_by_email(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_find_by_email_error(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.get('/api/contacts/find/email/kuku@kuuu.com', headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -152,15 +233,35 @@ def test_find_by_email_error(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_get_all(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.get('/api/contacts/find/birthday', headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_200_OK
 
 
+@mark.usefixtures('mock_rate_limit')
+def test_find_birthday_whole_year(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get('/api/contacts/find/birthday/', params={"days": 365},
+                              headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert [contact["email"] for contact in data] == ["user@example.com"]
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_find_birthday_bad_window(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get('/api/contacts/find/birthday/', params={"days": 400},
+                              headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
 @mark.usefixtures('mock_rate_limit')
 def test_update(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.put("/api/contacts/1",
                               json={"first_name": "Pater", "last_name": "Dow", "email": "user@example.com",
@@ -173,7 +274,7 @@ def test_update(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_update_error(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.put("/api/contacts/100",
                               json={"first_name": "Pater", "last_name": "Dow", "email": "user@example.com",
@@ -184,9 +285,29 @@ def test_update_error(client, token):
         assert data["detail"] == "Not found"
 
 
+@mark.usefixtures('mock_rate_limit')
+def test_get_one_cached(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock, \
+            patch.object(repository_contact, 'get_one', wraps=repository_contact.get_one) as get_one:
+        r_mock.get.return_value = None
+        first = client.get("/api/contacts/1", headers={"Authorization": f"Bearer {token}"})
+        second = client.get("/api/contacts/1", headers={"Authorization": f"Bearer {token}"})
+        assert second.status_code == status.HTTP_200_OK
+        assert second.json() == first.json()
+        assert get_one.await_count == 1
+        response = client.put("/api/contacts/1",
+                              json={"first_name": "Pater", "last_name": "Dow", "email": "user@example.com",
+                                    "phone": "2877064128", "birthday": "2023-04-23T15:28:13.286Z"},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        client.get("/api/contacts/1", headers={"Authorization": f"Bearer {token}"})
+        # the update bumped the data version, the next read goes to db again
+        assert get_one.await_count == 3
+
+
 @mark.usefixtures('mock_rate_limit')
 def test_delete(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.delete("/api/contacts/1", headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_204_NO_CONTENT
@@ -194,7 +315,7 @@ def test_delete(client, token):
 
 @mark.usefixtures('mock_rate_limit')
 def test_delete_error(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.delete("/api/contacts/100", headers={"Authorization": f"Bearer {token}"},)
         assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -202,12 +323,114 @@ def test_delete_error(client, token):
         assert data["detail"] == "Not found"
 
 
+@mark.usefixtures('mock_rate_limit')
+def test_import_csv(client, token):
+    content = ("first_name,last_name,email,phone,birthday\n"
+               "Ann,Lee,ann@example.com,2877064120,1990-01-02T00:00:00\n"
+               "Ann,Twice,ann@example.com,2877064120,1990-01-02T00:00:00\n"
+               "Bob,Bad,not-an-email,2877064121,1990-01-02T00:00:00\n")
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.post("/api/contacts/import", files={"file": ("contacts.csv", content, "text/csv")},
+                               headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_200_OK, response.text
+        data = response.json()
+        assert data["imported"] == 1
+        assert data["duplicates"] == 1
+        assert data["failed"] == 1
+        assert data["errors"][0]["row"] == 3
+        assert data["errors"][0]["errors"][0].startswith("email")
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_import_ndjson(client, token):
+    content = ('{"first_name": "Ann", "last_name": "Lee", "email": "ann@example.com", "phone": "2877064120", '
+               '"birthday": "1990-01-02T00:00:00"}\n'
+               '{"first_name": "Cid", "last_name": "Moe", "email": "cid@example.com", "phone": "2877064122", '
+               '"birthday": "1991-05-06T00:00:00"}\n'
+               '\n'
+               '{broken\n')
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.post("/api/contacts/import", params={"format": "ndjson"},
+                               files={"file": ("contacts.txt", content)},
+                               headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_200_OK, response.text
+        data = response.json()
+        assert data["imported"] == 1
+        assert data["duplicates"] == 1
+        assert data["failed"] == 1
+        response = client.get('/api/contacts/find/email/cid@example.com', headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_200_OK
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_export_ndjson(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/contacts/export", headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["email"] for row in rows] == ["ann@example.com", "cid@example.com"]
+        assert rows[1]["birthday"] == "1991-05-06T00:00:00"
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_export_csv(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/contacts/export", params={"format": "csv"},
+                              headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.splitlines()
+        assert lines[0] == "id,first_name,last_name,email,phone,birthday"
+        assert len(lines) == 3
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_update_bulk(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch("/api/contacts/bulk",
+                                json={"filter": {"last_name": "Moe"}, "values": {"phone": "2877064199"}},
+                                headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_200_OK, response.text
+        contact_id, = response.json()["ids"]
+        response = client.get(f"/api/contacts/{contact_id}", headers={"Authorization": f"Bearer {token}"},)
+        assert response.json()["phone"] == "2877064199"
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_update_bulk_without_selection(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch("/api/contacts/bulk", json={"values": {"phone": "2877064199"}},
+                                headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_delete_bulk(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/contacts", headers={"Authorization": f"Bearer {token}"},)
+        ids = [contact["id"] for contact in response.json()]
+        response = client.request("DELETE", "/api/contacts/bulk", json={"ids": ids + [1000]},
+                                  headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_200_OK, response.text
+        assert sorted(response.json()["ids"]) == ids
+        response = client.get("/api/contacts", headers={"Authorization": f"Bearer {token}"},)
+        assert response.json() == []
+
+
 """ 
 copy-paste
       
 @mark.usefixtures('mock_rate_limit')
 def test_ (client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.post()
     assert response.status_code == status.HTTP_200_OK
@@ -217,7 +440,7 @@ def test_ (client, token):
         
 @mark.usefixtures('mock_rate_limit')
 def test_ _error(client, token):
-    with patch.object(auth_service, 'redis_db') as r_mock:
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
         r_mock.get.return_value = None
         response = client.post()
     assert response.status_code == status.HTTP_404_NOT_FOUND
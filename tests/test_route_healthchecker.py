@@ -0,0 +1,36 @@
+from fastapi import status
+from sqlalchemy.pool import QueuePool
+
+from src.database.connector import PoolStats
+
+
+def test_pool_status(client):
+    response = client.get("/api/healthchecker/pool")
+    assert response.status_code == status.HTTP_200_OK, response.text
+    data = response.json()
+    assert "checked_out" in data
+    assert "idle" in data
+    assert "overflow" in data
+    assert "wait_avg_ms" in data
+
+
+def test_pool_stats_snapshot():
+    pool = QueuePool(lambda: None, pool_size=3, max_overflow=2)
+    stats = PoolStats()
+    stats.observe(0.002)
+    stats.observe(0.004)
+    data = stats.snapshot(pool)
+    assert data["size"] == 3
+    assert data["checked_out"] == 0
+    assert data["overflow"] == 0
+    assert data["checkouts"] == 2
+    assert data["wait_avg_ms"] == 3.0
+    assert data["wait_max_ms"] == 4.0
+
+
+def test_token_cache_status(client):
+    response = client.get("/api/healthchecker/tokens")
+    assert response.status_code == status.HTTP_200_OK, response.text
+    data = response.json()
+    assert "hits" in data
+    assert "misses" in data
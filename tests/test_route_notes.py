@@ -0,0 +1,165 @@
+from unittest.mock import AsyncMock, patch
+
+from pytest import mark, fixture
+
+from src.conf.config import settings
+from src.database.models import Note, User
+from src.repository import notes as repository_notes
+from src.services.response_cache import response_cache
+from src.services.user_cache import user_cache
+from fastapi import status
+
+
+@fixture(scope='function')
+def token(client, user, session, monkeypatch):
+    mock_send_email = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    client.post("/api/auth/signup", json=user)
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.confirmed = True
+    session.commit()
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    data = response.json()
+    return data["access_token"]
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_create_note(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.post(
+            "/api/contacts",
+            json={"first_name": "John", "last_name": "Dow", "email": "user@example.com", "phone": "2877064128",
+                  "birthday": "2023-04-23T15:28:13.286Z"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == status.HTTP_201_CREATED, response.text
+        contact_id = response.json()["id"]
+        for text in ("first", "second, with comma"):
+            response = client.post("/api/note", json={"text": text, "contact_id": contact_id},
+                                   headers={"Authorization": f"Bearer {token}"},)
+            assert response.status_code == status.HTTP_201_CREATED, response.text
+            assert response.json()["text"] == text
+
+
+def test_get_notes(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/note", headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_200_OK
+        assert [note["text"] for note in response.json()] == ["first", "second, with comma"]
+
+
+def test_get_notes_cursor(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/note", params={"limit": 1}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert [note["text"] for note in response.json()] == ["first"]
+        cursor = response.headers["X-Next-Cursor"]
+        response = client.get("/api/note", params={"limit": 1, "after": cursor},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert [note["text"] for note in response.json()] == ["second, with comma"]
+        response = client.get("/api/note", params={"limit": 1, "after": response.headers["X-Next-Cursor"]},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.json() == []
+        assert "X-Next-Cursor" not in response.headers
+
+
+def test_get_notes_include_contact(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/note", headers={"Authorization": f"Bearer {token}"})
+        assert all("contact" not in note for note in response.json())
+        response = client.get("/api/note", params={"include": "contact"}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert [note["contact"]["email"] for note in response.json()] == ["user@example.com"] * 2
+        response = client.get("/api/note", params={"include": "user"}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_get_notes_fast(client, token, monkeypatch):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        expected = client.get("/api/note", headers={"Authorization": f"Bearer {token}"})
+        monkeypatch.setattr(settings, 'fast_list_responses', True)
+        # skip the response cache filled by the first call
+        monkeypatch.setattr(response_cache, 'get', AsyncMock(return_value=(None, None)))
+        response = client.get("/api/note", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == expected.json()
+
+
+def test_get_notes_not_modified(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock, \
+            patch.object(repository_notes, 'get_all', wraps=repository_notes.get_all) as get_all:
+        r_mock.get.return_value = None
+        response = client.get("/api/note", headers={"Authorization": f"Bearer {token}"})
+        etag = response.headers["ETag"]
+        assert etag.startswith('W/"')
+        response = client.get("/api/note", headers={"Authorization": f"Bearer {token}", "If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["ETag"] == etag
+        assert get_all.await_count == 1
+        response = client.put("/api/note/1", json={"text": "first", "contact_id": 1},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        response = client.get("/api/note", headers={"Authorization": f"Bearer {token}", "If-None-Match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["ETag"] != etag
+        assert get_all.await_count == 2
+
+
+def test_export_csv(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/note/export", params={"format": "csv"},
+                              headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.text.splitlines() == ["id,contact_id,text", "1,1,first", '2,1,"second, with comma"']
+
+
+def test_export_bad_format(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/note/export", params={"format": "xml"},
+                              headers={"Authorization": f"Bearer {token}"},)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@mark.usefixtures('mock_rate_limit')
+def test_contacts_of_other_users_are_not_exposed(client, token, session):
+    client.post("/api/auth/signup", json={"name": "wade", "email": "wade@example.com", "password": "123456789"})
+    other: User = session.query(User).filter(User.email == "wade@example.com").first()
+    other.confirmed = True
+    session.commit()
+    other_token = client.post(
+        "/api/auth/login", data={"username": "wade@example.com", "password": "123456789"},
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {other_token}"}
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.post("/api/note", json={"text": "stolen", "contact_id": 1}, headers=headers)
+        assert response.status_code == status.HTTP_404_NOT_FOUND, response.text
+        response = client.post(
+            "/api/contacts",
+            json={"first_name": "Wade", "last_name": "Wilson", "email": "wilson@example.com", "phone": "2877064129",
+                  "birthday": "2023-04-23T15:28:13.286Z"},
+            headers=headers,
+        )
+        own_contact_id = response.json()["id"]
+        response = client.post("/api/note", json={"text": "mine", "contact_id": own_contact_id}, headers=headers)
+        assert response.status_code == status.HTTP_201_CREATED, response.text
+        note_id = response.json()["id"]
+        response = client.put(f"/api/note/{note_id}", json={"text": "mine", "contact_id": 1}, headers=headers)
+        assert response.status_code == status.HTTP_404_NOT_FOUND, response.text
+        # a row written before the check existed still does not embed the contact of another user
+        session.add(Note(text="legacy", contact_id=1, user_id=other.id))
+        session.commit()
+        response = client.get("/api/note", params={"include": "contact"}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert [(note["text"], note["contact"] and note["contact"]["email"]) for note in response.json()] == \
+            [("mine", "wilson@example.com"), ("legacy", None)]
@@ -0,0 +1,127 @@
+import io
+from unittest.mock import AsyncMock, patch
+
+from PIL import Image
+from pytest import fixture
+
+from src.database.models import User
+from src.services.avatars import avatars, FileSystemStorage
+from src.services.user_cache import user_cache
+from fastapi import status
+
+
+@fixture(scope='function')
+def token(client, user, session, monkeypatch):
+    mock_send_email = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    client.post("/api/auth/signup", json=user)
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.confirmed = True
+    session.commit()
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    data = response.json()
+    return data["access_token"]
+
+
+@fixture(scope='function')
+def avatar_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, 'storage', FileSystemStorage(tmp_path, '/api/users/avatars'))
+    return tmp_path
+
+
+def image(width: int, height: int, fmt: str = 'PNG') -> bytes:
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(output, format=fmt)
+    return output.getvalue()
+
+
+def test_read_users_me(client, token):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/users/me/", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK, response.text
+        assert response.json()["email"] == "deadpool@example.com"
+
+
+def upload_avatar(client, token, data: bytes):
+    return client.patch(
+        "/api/users/avatar",
+        files={"file": ("avatar.png", data, "image/png")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+
+def test_update_avatar(client, token, avatar_dir):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = upload_avatar(client, token, image(600, 400))
+        assert response.status_code == status.HTTP_200_OK, response.text
+        name = response.json()["avatar"].removeprefix("/api/users/avatars/")
+        with Image.open(avatar_dir / name[:2] / name) as thumbnail:
+            assert thumbnail.size == (250, 250)
+            assert thumbnail.format == "JPEG"
+
+
+def test_update_avatar_same_image_is_stored_once(client, token, avatar_dir, monkeypatch):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        first = upload_avatar(client, token, image(300, 300)).json()["avatar"]
+        thumbnail_mock = AsyncMock()
+        monkeypatch.setattr(avatars, 'thumbnail', thumbnail_mock)
+        response = upload_avatar(client, token, image(300, 300))
+        assert response.status_code == status.HTTP_200_OK, response.text
+        assert response.json()["avatar"] == first
+        thumbnail_mock.assert_not_awaited()
+
+
+def test_get_avatar(client, token, avatar_dir):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        url = upload_avatar(client, token, image(500, 500)).json()["avatar"]
+    response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK, response.text
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    etag = response.headers["etag"]
+    assert etag == f'"{url.split("/")[-1].removesuffix(".jpg")}"'
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_get_avatar_not_found(client, avatar_dir):
+    response = client.get(f"/api/users/avatars/{'0' * 64}-250.jpg")
+    assert response.status_code == status.HTTP_404_NOT_FOUND, response.text
+    response = client.get(f"/api/users/avatars/{'0' * 64}-250.jpg", headers={"If-None-Match": "*"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND, response.text
+    response = client.get("/api/users/avatars/..%2F..%2Fetc%2Fpasswd")
+    assert response.status_code in (status.HTTP_404_NOT_FOUND, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+def test_update_avatar_too_large(client, token, avatar_dir, monkeypatch):
+    monkeypatch.setattr(avatars, 'max_bytes', 1024)
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch(
+            "/api/users/avatar",
+            files={"file": ("avatar.bmp", image(600, 400, 'BMP'), "image/bmp")},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, response.text
+        assert list(avatar_dir.iterdir()) == []
+
+
+def test_update_avatar_not_image(client, token, avatar_dir):
+    with patch.object(user_cache, 'redis_db', new_callable=AsyncMock) as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch(
+            "/api/users/avatar",
+            files={"file": ("avatar.png", b"not an image", "image/png")},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST, response.text
+        assert response.json()["detail"] == "Invalid image"
@@ -2,20 +2,25 @@ import unittest
 
 from unittest.mock import MagicMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User, Contact
-from src.schemas import ContactModel
+from src.schemas import ContactModel, ContactBulkSelect
 from src.repository.contacts import (
     create,
+    create_many,
     get_all,
     get_one,
     update,
     delete,
+    update_many,
+    delete_many,
     find_by_name,
     find_by_email,
     find_by_lastname,
     find_birthday7day,
+    find_upcoming_birthdays,
 )
 import datetime
 
@@ -23,7 +28,7 @@ import datetime
 class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
         self.user = User(id=1)
 
     async def test_create(self):
@@ -33,23 +38,50 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.first_name, body.first_name)
         self.assertEqual(result.last_name, body.last_name)
         self.assertEqual(result.email, body.email)
+        self.assertEqual(result.birthday_md, body.birthday.month * 100 + body.birthday.day)
         self.assertTrue(hasattr(result, "id"))
 
+    async def test_create_many(self):
+        bodies = [ContactModel(first_name="test", last_name="last", email=email, phone="234-345-2343",
+                               birthday=datetime.datetime.now())
+                  for email in ("old@email.com", "new@email.com", "new@email.com")]
+        self.session.execute.return_value = MagicMock()
+        self.session.execute.return_value.scalars.return_value.all.return_value = [2]
+        result = await create_many(bodies=bodies, user=self.user, db=self.session)
+        self.assertEqual(result, 1)
+        statement, rows = self.session.execute.call_args.args
+        self.assertIn("ON CONFLICT", str(statement.compile(dialect=sqlite.dialect())))
+        self.assertEqual([row["email"] for row in rows], ["old@email.com", "new@email.com"])
+        self.assertEqual(rows[0]["user_id"], self.user.id)
+
+    async def test_create_many_all_exist(self):
+        bodies = [ContactModel(first_name="test", last_name="last", email="old@email.com", phone="234-345-2343",
+                               birthday=datetime.datetime.now())]
+        self.session.execute.return_value = MagicMock()
+        self.session.execute.return_value.scalars.return_value.all.return_value = []
+        result = await create_many(bodies=bodies, user=self.user, db=self.session)
+        self.assertEqual(result, 0)
+
+    async def test_create_many_empty(self):
+        result = await create_many(bodies=[], user=self.user, db=self.session)
+        self.assertEqual(result, 0)
+        self.session.execute.assert_not_called()
+
     async def test_get_all(self):
         contacts = [Contact(), ]
-        self.session.query().filter().offset().limit().all.return_value = contacts
+        self.session.scalars.return_value.all = MagicMock(return_value=contacts)
         result = await get_all(skip=0, limit=10, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
         self.assertListEqual(result, contacts)
 
     async def test_get_one_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.session.scalar.return_value = contact
         result = await get_one(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_one_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         result = await get_one(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
@@ -57,7 +89,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         contact = Contact()
         body = ContactModel(first_name="test", last_name="last", email="test@email.com", phone="234-345-2343",
                             birthday=datetime.datetime.now())
-        self.session.query().filter().first.return_value = contact
+        self.session.scalar.return_value = contact
         self.session.commit.return_value = None
         result = await update(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertEqual(result, contact)
@@ -65,62 +97,82 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     async def test_update_not_found(self):
         body = ContactModel(first_name="test", last_name="last", email="test@email.com", phone="234-345-2343",
                             birthday=datetime.datetime.now())
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         self.session.commit.return_value = None
         result = await update(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_delete_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.session.scalar.return_value = contact
         result = await delete(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_delete_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         result = await delete(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
+    async def test_update_many(self):
+        self.session.execute.return_value = MagicMock(**{'scalars.return_value.all.return_value': [1, 2]})
+        selection = ContactBulkSelect(ids=[1, 2, 3])
+        result = await update_many(selection=selection, values={"birthday": datetime.datetime(2000, 3, 4)},
+                                   user=self.user, db=self.session)
+        self.assertListEqual(result, [1, 2])
+        self.session.commit.assert_awaited_once()
+
+    async def test_delete_many(self):
+        self.session.execute.return_value = MagicMock(**{'scalars.return_value.all.return_value': []})
+        selection = ContactBulkSelect(filter={"last_name": "last"})
+        result = await delete_many(selection=selection, user=self.user, db=self.session)
+        self.assertListEqual(result, [])
+
     async def test_find_by_name_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.session.scalar.return_value = contact
         result = await find_by_name(contact_name='test', user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_find_by_name_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         result = await find_by_name(contact_name='test', user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_find_by_lastname_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.session.scalar.return_value = contact
         result = await find_by_lastname(lastname='test', user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_find_by_lastname_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         result = await find_by_lastname(lastname='test', user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_find_by_email_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.session.scalar.return_value = contact
         result = await find_by_email(email='test@email.com', user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_find_by_email_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         result = await find_by_email(email='test@email.com', user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_find_birthday7day(self):
         contacts = []
-        self.session.query().filter().all.return_value = contacts
+        self.session.scalars.return_value.all = MagicMock(return_value=contacts)
         result = await find_birthday7day(user=self.user, db=self.session)
         self.assertEqual(result, contacts)
         self.assertListEqual(result, contacts)
 
+    async def test_find_upcoming_birthdays(self):
+        contacts = [Contact(), ]
+        self.session.scalars.return_value.all = MagicMock(return_value=contacts)
+        result = await find_upcoming_birthdays(days=30, user=self.user, db=self.session)
+        self.assertListEqual(result, contacts)
+
 
 if __name__ == '__main__':
     unittest.main()
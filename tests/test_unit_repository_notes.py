@@ -2,7 +2,7 @@ import unittest
 
 from unittest.mock import MagicMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User, Note
 from src.schemas import NoteModel
@@ -18,37 +18,54 @@ from src.repository.notes import (
 class TestNotes(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
         self.user = User(id=1)
 
     async def test_get_all(self):
         notes = [Note(), ]
-        self.session.query().filter().all.return_value = notes
-        result = await get_all(user=self.user, db=self.session)
+        self.session.scalars.return_value.all = MagicMock(return_value=notes)
+        result = await get_all(limit=10, user=self.user, db=self.session)
         self.assertEqual(result, notes)
         self.assertListEqual(result, notes)
 
+    async def test_get_all_with_contact(self):
+        notes = [Note(), ]
+        self.session.scalars.return_value.all = MagicMock(return_value=notes)
+        result = await get_all(limit=10, user=self.user, db=self.session, after=5, with_contact=True)
+        self.assertEqual(result, notes)
+        query = self.session.scalars.call_args.args[0]
+        self.assertEqual(len(query._with_options), 1)
+        self.assertIn('notes.id >', str(query))
+
     async def test_create(self):
         body = NoteModel(contact_id=1, text="test")
+        self.session.scalar.return_value = 1
         result = await create(body=body, user=self.user, db=self.session)
         self.assertEqual(result.contact_id, body.contact_id)
         self.assertEqual(result.text, body.text)
         self.assertTrue(hasattr(result, "id"))
 
+    async def test_create_foreign_contact(self):
+        body = NoteModel(contact_id=2, text="test")
+        self.session.scalar.return_value = None
+        result = await create(body=body, user=self.user, db=self.session)
+        self.assertIsNone(result)
+        self.session.add.assert_not_called()
+
     async def test_get_one_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         result = await get_one(note_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_get_one_found(self):
         note = Note()
-        self.session.query().filter().first.return_value = note
+        self.session.scalar.return_value = note
         result = await get_one(note_id=1, user=self.user, db=self.session)
         self.assertEqual(result, note)
 
     async def test_update_not_found(self):
         body = NoteModel(note_id=1, text="test")
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         self.session.commit.return_value = None
         result = await update(note_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
@@ -56,19 +73,28 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
     async def test_update_found(self):
         note = Note()
         body = NoteModel(note_id=1, text="test")
-        self.session.query().filter().first.return_value = note
+        self.session.scalar.return_value = note
         self.session.commit.return_value = None
         result = await update(note_id=1, body=body, user=self.user, db=self.session)
         self.assertEqual(result, note)
 
+    async def test_update_foreign_contact(self):
+        note = Note(contact_id=1, text="old")
+        body = NoteModel(contact_id=2, text="test")
+        self.session.scalar.side_effect = [note, None]
+        result = await update(note_id=1, body=body, user=self.user, db=self.session)
+        self.assertIsNone(result)
+        self.assertEqual((note.contact_id, note.text), (1, "old"))
+        self.session.commit.assert_not_called()
+
     async def test_delete_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         result = await delete(note_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_delete_found(self):
         note = Note()
-        self.session.query().filter().first.return_value = note
+        self.session.scalar.return_value = note
         result = await delete(note_id=1, user=self.user, db=self.session)
         self.assertEqual(result, note)
 
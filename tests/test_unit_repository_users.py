@@ -1,16 +1,18 @@
 import unittest
 
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from sqlalchemy.orm import Session
+from redis.exceptions import ConnectionError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel
+from src.services.user_cache import user_cache
 from src.repository.users import (
     get_user_by_email,
     create_user,
     confirmed_email,
-    update_token,
+    update_password,
     update_avatar,
 )
 
@@ -18,16 +20,18 @@ from src.repository.users import (
 class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.redis_db = patch.object(user_cache, 'redis_db', new_callable=AsyncMock).start()
+        self.addCleanup(patch.stopall)
 
     async def test_get_user_by_email_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         result = await get_user_by_email(email='test@example.com', db=self.session)
         self.assertIsNone(result)
 
     async def test_get_user_by_email_found(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.session.scalar.return_value = user
         result = await get_user_by_email(email='test@example.com', db=self.session)
         self.assertEqual(result, user)
 
@@ -43,15 +47,28 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         result = await confirmed_email(email='test@example.com', db=self.session)
         self.assertIsNone(result)
 
-    async def test_update_token_found(self):
-        result = await update_token(user=User(), token='123', db=self.session)
+    async def test_update_password(self):
+        user = User(password='old')
+        result = await update_password(user=user, password_hash='new', db=self.session)
         self.assertIsNone(result)
+        self.assertEqual(user.password, 'new')
+        self.session.commit.assert_awaited_once()
 
     async def test_update_avatar_found(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.session.scalar.return_value = user
         result = await update_avatar(email='test@example.com', url='www.test.pic/1212.gif', db=self.session)
         self.assertEqual(result, user)
+        self.redis_db.delete.assert_awaited_once_with('user:test@example.com')
+
+
+    async def test_update_avatar_redis_down(self):
+        user = User()
+        self.session.scalar.return_value = user
+        self.redis_db.delete.side_effect = ConnectionError('down')
+        result = await update_avatar(email='test@example.com', url='www.test.pic/1212.gif', db=self.session)
+        self.assertEqual(result, user)
+        self.session.commit.assert_awaited_once()
 
 
 if __name__ == '__main__':
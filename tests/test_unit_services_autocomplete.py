@@ -0,0 +1,67 @@
+import unittest
+
+from unittest.mock import MagicMock
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User, Contact
+from src.services.autocomplete import PrefixIndex, AutocompleteCache
+
+
+class TestPrefixIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex([(1, "John", "Dow"), (2, "Johanna", "Smith"), (3, "Mary", "Johnson")])
+
+    def test_search_first_and_last_name(self):
+        result = self.index.search("joh", limit=10)
+        self.assertEqual([row["id"] for row in result], [2, 1, 3])
+
+    def test_search_limit(self):
+        result = self.index.search("j", limit=2)
+        self.assertEqual(len(result), 2)
+
+    def test_search_not_found(self):
+        self.assertEqual(self.index.search("zed", limit=10), [])
+
+    def test_add_replaces_names(self):
+        self.index.add(1, "Peter", "Dow")
+        self.assertEqual([row["id"] for row in self.index.search("joh", limit=10)], [2, 3])
+        self.assertEqual(self.index.search("pet", limit=10), [{"id": 1, "first_name": "Peter", "last_name": "Dow"}])
+
+    def test_remove(self):
+        self.index.remove(3)
+        self.index.remove(100)
+        self.assertEqual([row["id"] for row in self.index.search("joh", limit=10)], [2, 1])
+
+
+class TestAutocompleteCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.session = MagicMock(spec=AsyncSession)
+        self.session.execute.return_value.all = MagicMock(return_value=[(1, "John", "Dow")])
+        self.cache = AutocompleteCache(max_users=1, ttl=60)
+
+    async def test_get_builds_once(self):
+        user = User(id=1)
+        index = await self.cache.get(user, self.session)
+        self.assertIs(await self.cache.get(user, self.session), index)
+        self.session.execute.assert_awaited_once()
+
+    async def test_lru_eviction(self):
+        await self.cache.get(User(id=1), self.session)
+        await self.cache.get(User(id=2), self.session)
+        self.assertListEqual(list(self.cache.indexes), [2])
+
+    async def test_saved_and_removed(self):
+        user = User(id=1)
+        index = await self.cache.get(user, self.session)
+        contact = Contact(id=2, first_name="Jane", last_name="Roe", user_id=1)
+        self.cache.saved(contact)
+        self.assertEqual(len(index.search("j", limit=10)), 2)
+        self.cache.removed(contact)
+        self.assertEqual(len(index.search("j", limit=10)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
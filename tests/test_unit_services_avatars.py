@@ -0,0 +1,78 @@
+import io
+import tempfile
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from fastapi import HTTPException
+from PIL import Image
+
+from src.services.avatars import AvatarService, AvatarStorage, FileSystemStorage, make_thumbnail
+from src.services.conditional import etag_matches
+
+
+class TestMakeThumbnail(unittest.TestCase):
+
+    def test_square_jpeg(self):
+        source = io.BytesIO()
+        Image.new('RGBA', (300, 900), (0, 0, 255, 128)).save(source, format='PNG')
+        with Image.open(io.BytesIO(make_thumbnail(source.getvalue(), 250))) as thumbnail:
+            self.assertEqual(thumbnail.size, (250, 250))
+            self.assertEqual(thumbnail.format, 'JPEG')
+
+
+class TestFileSystemStorage(unittest.IsolatedAsyncioTestCase):
+
+    async def test_save_and_find(self):
+        with tempfile.TemporaryDirectory() as directory:
+            storage = FileSystemStorage(Path(directory) / 'avatars', '/api/users/avatars/')
+            self.assertIsNone(await storage.find('abcd-250.jpg'))
+            self.assertIsNone(await storage.local_file('abcd-250.jpg'))
+            url = await storage.save('abcd-250.jpg', b'data')
+            self.assertEqual(url, '/api/users/avatars/abcd-250.jpg')
+            self.assertEqual(await storage.find('abcd-250.jpg'), url)
+            self.assertEqual(await storage.local_file('abcd-250.jpg'), storage.path('abcd-250.jpg'))
+            self.assertEqual((Path(directory) / 'avatars' / 'ab' / 'abcd-250.jpg').read_bytes(), b'data')
+            self.assertEqual([path.name for path in (Path(directory) / 'avatars' / 'ab').iterdir()], ['abcd-250.jpg'])
+
+
+class TestAvatarService(unittest.IsolatedAsyncioTestCase):
+
+    def test_storage_needs_save(self):
+        with self.assertRaises(TypeError):
+            AvatarStorage()
+
+    def test_workers_are_not_forked(self):
+        service = AvatarService(FileSystemStorage('avatars', '/api/users/avatars'), max_bytes=1024, workers=1)
+        service.start()
+        try:
+            self.assertIn(service.executor._mp_context.get_start_method(), ('forkserver', 'spawn'))
+        finally:
+            service.shutdown()
+
+    async def test_broken_pool_is_unavailable(self):
+        service = AvatarService(FileSystemStorage('avatars', '/api/users/avatars'), max_bytes=1024)
+        service.executor = MagicMock()
+        with patch('asyncio.BaseEventLoop.run_in_executor', side_effect=BrokenProcessPool):
+            with self.assertRaises(HTTPException) as cm:
+                await service.thumbnail(b'data')
+        self.assertEqual(cm.exception.status_code, 503)
+        self.assertIsNone(service.executor)
+
+
+class TestEtagMatches(unittest.TestCase):
+
+    def test_matches(self):
+        self.assertTrue(etag_matches('"abc"', '"abc"'))
+        self.assertTrue(etag_matches('"abc"', '"x", W/"abc"'))
+        self.assertTrue(etag_matches('W/"abc"', '"abc"'))
+        self.assertTrue(etag_matches('"abc"', '*'))
+
+    def test_not_matches(self):
+        self.assertFalse(etag_matches('"abc"', None))
+        self.assertFalse(etag_matches('"abc"', '"abcd"'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from datetime import date, datetime
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, Contact, DigestRun, OutboxEmail, User
+from src.services.birthday_digest import BirthdayDigest
+from src.services.email import MailDispatcher, conf
+
+
+class TestBirthdayDigest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{self.directory.name}/digest.db", poolclass=NullPool)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        self.sessions = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        async with self.sessions() as db:
+            for user_id in (1, 2, 3, 4):
+                db.add(User(id=user_id, name=f"user{user_id}", email=f"user{user_id}@example.com", password="hash",
+                            confirmed=user_id != 3))
+            db.add_all([
+                Contact(first_name="John", last_name="Dow", email="john@example.com", user_id=1,
+                        birthday=datetime(1990, 12, 30)),
+                Contact(first_name="Mary", last_name="Roe", email="mary@example.com", user_id=1,
+                        birthday=datetime(1985, 1, 2)),
+                Contact(first_name="Late", last_name="Roe", email="late@example.com", user_id=1,
+                        birthday=datetime(1985, 2, 2)),
+                Contact(first_name="Unconfirmed", last_name="Roe", email="u@example.com", user_id=3,
+                        birthday=datetime(1985, 12, 29)),
+                Contact(first_name="Peter", last_name="Pan", email="peter@example.com", user_id=4,
+                        birthday=datetime(2000, 12, 28)),
+            ])
+            await db.commit()
+        self.dispatcher = MailDispatcher(conf, self.sessions)
+        self.job = BirthdayDigest(self.sessions, self.dispatcher, days=7, chunk_size=1)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.directory.cleanup()
+
+    async def outbox(self) -> list[OutboxEmail]:
+        async with self.sessions() as db:
+            return (await db.scalars(select(OutboxEmail).order_by(OutboxEmail.id))).all()
+
+    async def test_run(self):
+        result = await self.job.run(date(2023, 12, 28))
+        self.assertEqual(result, {"users": 3, "digests": 2})
+        emails = await self.outbox()
+        self.assertEqual([email.recipient for email in emails], ["user1@example.com", "user4@example.com"])
+        body = json.loads(emails[0].template_body)
+        self.assertEqual(body["birthdays"], [{"name": "John Dow", "date": "30.12"},
+                                             {"name": "Mary Roe", "date": "02.01"}])
+
+    async def test_run_is_not_repeated(self):
+        await self.job.run(date(2023, 12, 28))
+        self.assertEqual(await self.job.run(date(2023, 12, 28)), {"users": 3, "digests": 2})
+        self.assertEqual(len(await self.outbox()), 2)
+
+    async def test_run_resumes_after_last_chunk(self):
+        async with self.sessions() as db:
+            db.add(DigestRun(run_date=date(2023, 12, 28), last_user_id=1, users=1, digests=1))
+            await db.commit()
+        result = await self.job.run(date(2023, 12, 28))
+        self.assertEqual(result, {"users": 3, "digests": 2})
+        self.assertEqual([email.recipient for email in await self.outbox()], ["user4@example.com"])
+
+    async def test_contacts_without_birthday_are_skipped(self):
+        async with self.sessions() as db:
+            db.add(Contact(first_name="No", last_name="Birthday", email="nobody@example.com", user_id=4))
+            await db.commit()
+        job = BirthdayDigest(self.sessions, self.dispatcher, days=365, chunk_size=10)
+        self.assertEqual(await job.run(date(2023, 12, 28)), {"users": 3, "digests": 2})
+        body = json.loads((await self.outbox())[1].template_body)
+        self.assertEqual(body["birthdays"], [{"name": "Peter Pan", "date": "28.12"}])
+
+    async def test_schedule_survives_failed_run(self):
+        job = BirthdayDigest(self.sessions, self.dispatcher, hour=0)
+        with patch.object(job, 'run', AsyncMock(side_effect=[RuntimeError("boom"), {"users": 0, "digests": 0}])), \
+                patch('src.services.birthday_digest.asyncio.sleep',
+                      AsyncMock(side_effect=[None, asyncio.CancelledError])):
+            with self.assertRaises(asyncio.CancelledError):
+                await job.schedule()
+            self.assertEqual(job.run.await_count, 2)
+
+    async def test_render_digest(self):
+        await self.job.run(date(2023, 12, 28))
+        message = await self.dispatcher.render((await self.outbox())[0])
+        html = message.get_payload()[0].get_payload(decode=True).decode()
+        self.assertIn("02.01 - Mary Roe", html)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import socket
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+from aiosmtpd.controller import Controller
+from fastapi_mail import ConnectionConfig
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, OutboxEmail
+from src.repository import outbox as repository_outbox
+from src.services.email import MailDispatcher, conf
+
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def local_config(port: int) -> ConnectionConfig:
+    return conf.copy(update={"MAIL_SERVER": "127.0.0.1", "MAIL_PORT": port, "MAIL_SSL_TLS": False,
+                             "MAIL_STARTTLS": False, "USE_CREDENTIALS": False})
+
+
+class TestMailDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{self.directory.name}/outbox.db", poolclass=NullPool)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        self.sessions = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.inbox = Inbox()
+        self.controller = Controller(self.inbox, hostname='127.0.0.1', port=free_port())
+        self.controller.start()
+
+    async def asyncTearDown(self):
+        self.controller.stop()
+        await self.engine.dispose()
+        self.directory.cleanup()
+
+    async def enqueue(self, count: int) -> list[int]:
+        ids = []
+        async with self.sessions() as db:
+            for i in range(count):
+                email = await repository_outbox.enqueue(
+                    f"user{i}@example.com", "Confirm your email ", "email_template.html",
+                    {"host": "http://localhost/", "username": f"user{i}", "token": "token"}, db
+                )
+                ids.append(email.id)
+        return ids
+
+    async def outbox(self) -> list[OutboxEmail]:
+        async with self.sessions() as db:
+            return (await db.scalars(select(OutboxEmail).order_by(OutboxEmail.id))).all()
+
+    async def test_batch_over_one_connection(self):
+        dispatcher = MailDispatcher(local_config(self.controller.port), self.sessions, connections=1)
+        await dispatcher.start()
+        for email_id in await self.enqueue(3):
+            dispatcher.submit(email_id)
+        for _ in range(100):
+            if len(self.inbox.messages) == 3:
+                break
+            await asyncio.sleep(0.05)
+        await dispatcher.stop()
+        self.assertEqual(sorted(m.rcpt_tos[0] for m in self.inbox.messages),
+                         ["user0@example.com", "user1@example.com", "user2@example.com"])
+        self.assertEqual(len(self.inbox.sessions), 1)
+        self.assertTrue(all(email.sent_at for email in await self.outbox()))
+
+    async def test_failed_email_is_retried_later(self):
+        dispatcher = MailDispatcher(local_config(free_port()), self.sessions, retry_delay=30)
+        ids = await self.enqueue(1)
+        await dispatcher.deliver(ids, dispatcher._smtp())
+        email, = await self.outbox()
+        self.assertIsNone(email.sent_at)
+        self.assertEqual(email.attempts, 1)
+        self.assertIsNotNone(email.last_error)
+        self.assertGreater(email.next_attempt_at, datetime.utcnow())
+        async with self.sessions() as db:
+            self.assertEqual(await repository_outbox.due_ids(10, 5, db), [])
+
+    async def test_invalid_recipient_fails_alone(self):
+        async with self.sessions() as db:
+            bad = await repository_outbox.enqueue(
+                "abcd", "Confirm your email ", "email_template.html",
+                {"host": "http://localhost/", "username": "abcd", "token": "token"}, db
+            )
+        ids = [bad.id] + await self.enqueue(1)
+        dispatcher = MailDispatcher(local_config(self.controller.port), self.sessions, connections=1)
+        await dispatcher.start()
+        for email_id in ids:
+            dispatcher.submit(email_id)
+        for _ in range(100):
+            if len(self.inbox.messages) == 1:
+                break
+            await asyncio.sleep(0.05)
+        self.assertFalse(any(worker.done() for worker in dispatcher.workers))
+        await dispatcher.stop()
+        self.assertEqual([m.rcpt_tos[0] for m in self.inbox.messages], ["user0@example.com"])
+        failed, sent = await self.outbox()
+        self.assertIsNone(failed.sent_at)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIsNotNone(failed.last_error)
+        self.assertIsNotNone(sent.sent_at)
+
+    async def test_worker_survives_unexpected_error(self):
+        dispatcher = MailDispatcher(local_config(self.controller.port), self.sessions, connections=1)
+        deliver = dispatcher.deliver
+        calls = []
+
+        async def flaky(ids, smtp):
+            calls.append(ids)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            await deliver(ids, smtp)
+
+        dispatcher.deliver = flaky
+        await dispatcher.start()
+        first, second = await self.enqueue(2)
+        dispatcher.submit(first)
+        for _ in range(100):
+            if calls:
+                break
+            await asyncio.sleep(0.05)
+        dispatcher.submit(second)
+        for _ in range(100):
+            if self.inbox.messages:
+                break
+            await asyncio.sleep(0.05)
+        await dispatcher.stop()
+        self.assertEqual([m.rcpt_tos[0] for m in self.inbox.messages], ["user1@example.com"])
+
+    async def test_sweeper_requeues_stored_emails(self):
+        ids = await self.enqueue(2)
+        dispatcher = MailDispatcher(local_config(self.controller.port), self.sessions, connections=1,
+                                    sweep_interval=0.05)
+        await dispatcher.start()
+        for _ in range(100):
+            if len(self.inbox.messages) == 2:
+                break
+            await asyncio.sleep(0.05)
+        await dispatcher.stop()
+        self.assertEqual(len(self.inbox.messages), 2)
+        self.assertEqual([email.id for email in await self.outbox() if email.sent_at], ids)
+
+    async def test_sweeper_survives_unreachable_db(self):
+        ids = await self.enqueue(1)
+        dispatcher = MailDispatcher(local_config(self.controller.port), self.sessions, connections=1,
+                                    sweep_interval=0.05)
+        due_ids = AsyncMock(side_effect=[OSError("connection refused"), ids] + [[]] * 1000)
+        with patch.object(repository_outbox, 'due_ids', due_ids):
+            await dispatcher.start()
+            for _ in range(100):
+                if self.inbox.messages:
+                    break
+                await asyncio.sleep(0.05)
+            self.assertFalse(dispatcher.sweeper.done())
+            await dispatcher.stop()
+        self.assertGreaterEqual(due_ids.await_count, 2)
+        self.assertEqual([m.rcpt_tos[0] for m in self.inbox.messages], ["user0@example.com"])
+
+    async def test_claimed_email_is_not_sent_twice(self):
+        ids = await self.enqueue(1)
+        async with self.sessions() as db:
+            self.assertEqual(len(await repository_outbox.claim(ids, 300, db)), 1)
+            self.assertEqual(await repository_outbox.claim(ids, 300, db), [])
+
+    async def test_render(self):
+        dispatcher = MailDispatcher(local_config(self.controller.port), self.sessions)
+        email = OutboxEmail(recipient="deadpool@example.com", subject="Confirm your email ",
+                            template="email_template.html",
+                            template_body=json.dumps({"host": "http://localhost/", "username": "deadpool",
+                                                      "token": "token"}))
+        message = await dispatcher.render(email)
+        self.assertEqual(message["To"], "deadpool@example.com")
+        self.assertIn("deadpool", message.as_string())
+
+    def test_submit_when_stopped(self):
+        dispatcher = MailDispatcher(local_config(self.controller.port), self.sessions)
+        self.assertFalse(dispatcher.submit(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import patch
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from redis.exceptions import ConnectionError
+
+from src.services.rate_limit import LocalBucket, RateLimits
+
+NOW = 1_699_999_990_000  # 10 seconds into a 60 seconds window
+
+
+class TestRateLimits(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.server = FakeServer()
+        self.redis_db = FakeRedis(server=self.server)
+        self.limits = RateLimits(self.redis_db, local_share=0.8)
+        clock = patch('src.services.rate_limit.time.time', return_value=NOW / 1000)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    async def hits(self, limits: RateLimits, count: int) -> list[int]:
+        return [await limits.hit('user:1', 10, 60000) for _ in range(count)]
+
+    async def test_local_hits_skip_redis(self):
+        self.assertEqual(await self.hits(self.limits, 8), [0] * 8)
+        self.assertEqual(await self.redis_db.keys('*'), [])
+
+    async def test_limit_is_exact_in_one_worker(self):
+        results = await self.hits(self.limits, 11)
+        self.assertEqual(results[:10], [0] * 10)
+        self.assertGreater(results[10], 0)
+        self.assertEqual(int(await self.redis_db.get(self.limits.key('user:1', NOW // 60000))), 10)
+
+    async def test_sync_shares_counts_between_workers(self):
+        other = RateLimits(FakeRedis(server=self.server), local_share=0.8)
+        self.assertEqual(await self.hits(self.limits, 6), [0] * 6)
+        await self.limits.sync()
+        results = await self.hits(other, 5)
+        self.assertEqual(results[:4], [0] * 4)
+        self.assertGreater(results[4], 0)
+
+    async def test_sync_loads_counts_of_other_workers(self):
+        other = RateLimits(FakeRedis(server=self.server), local_share=0.8)
+        await self.hits(other, 1)
+        await self.hits(self.limits, 5)
+        await self.limits.sync()
+        await other.sync()
+        self.assertEqual(other.buckets['user:1'].weighted(NOW), 6)
+
+    async def test_local_share_is_split_between_workers(self):
+        limits = RateLimits(self.redis_db, local_share=0.8, workers=2)
+        self.assertEqual(await self.hits(limits, 4), [0] * 4)
+        self.assertEqual(await self.redis_db.keys('*'), [])
+        self.assertEqual(await self.hits(limits, 1), [0])
+        self.assertEqual(int(await self.redis_db.get(limits.key('user:1', NOW // 60000))), 5)
+
+    async def test_workers_together_stay_under_limit(self):
+        first = RateLimits(self.redis_db, local_share=0.8, workers=2)
+        second = RateLimits(FakeRedis(server=self.server), local_share=0.8, workers=2)
+        results = await self.hits(first, 4) + await self.hits(second, 4)
+        await first.sync()
+        await second.sync()
+        await first.sync()
+        for _ in range(3):
+            results += await self.hits(first, 1) + await self.hits(second, 1)
+        self.assertEqual(results.count(0), 10)
+
+    async def test_sync_drops_idle_buckets(self):
+        await self.hits(self.limits, 1)
+        await self.limits.sync()
+        self.assertIn('user:1', self.limits.buckets)
+        with patch('src.services.rate_limit.time.time', return_value=NOW / 1000 + 120):
+            await self.limits.sync()
+        self.assertEqual(self.limits.buckets, {})
+
+    async def test_sync_drops_empty_buckets(self):
+        bucket = self.limits.buckets['user:1'] = LocalBucket(10, 60000)
+        await self.limits.load('user:1', bucket, NOW // 60000)
+        await self.limits.sync()
+        self.assertEqual(self.limits.buckets, {})
+
+    async def test_previous_window_is_weighted(self):
+        await self.redis_db.set(self.limits.key('user:1', NOW // 60000 - 1), 12)
+        # 50 of 60 seconds of the previous window are still inside the sliding window: 12 * 5 / 6 = 10
+        self.assertGreater(await self.limits.hit('user:1', 10, 60000), 0)
+
+    async def test_redis_down_limits_locally(self):
+        with patch.object(self.limits, 'script', side_effect=ConnectionError('down')):
+            results = await self.hits(self.limits, 11)
+        self.assertEqual(results[:10], [0] * 10)
+        self.assertGreater(results[10], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
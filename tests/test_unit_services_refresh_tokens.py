@@ -0,0 +1,38 @@
+import unittest
+
+from fakeredis.aioredis import FakeRedis
+
+from src.services.refresh_tokens import RefreshTokens
+
+
+class TestRefreshTokens(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.redis_db = FakeRedis()
+        self.tokens = RefreshTokens(self.redis_db, ttl=60)
+        await self.tokens.issue("deadpool@example.com", "first")
+
+    async def test_issue_stores_digest_with_ttl(self):
+        key = self.tokens.key("deadpool@example.com")
+        self.assertEqual(await self.redis_db.get(key), self.tokens.digest("first").encode())
+        self.assertLessEqual(await self.redis_db.ttl(key), 60)
+
+    async def test_rotate(self):
+        self.assertTrue(await self.tokens.rotate("deadpool@example.com", "first", "second"))
+        self.assertTrue(await self.tokens.rotate("deadpool@example.com", "second", "third"))
+
+    async def test_rotate_reused_token_revokes(self):
+        await self.tokens.rotate("deadpool@example.com", "first", "second")
+        self.assertFalse(await self.tokens.rotate("deadpool@example.com", "first", "other"))
+        self.assertFalse(await self.tokens.rotate("deadpool@example.com", "second", "third"))
+
+    async def test_rotate_unknown_user(self):
+        self.assertFalse(await self.tokens.rotate("nobody@example.com", "first", "second"))
+
+    async def test_revoke(self):
+        await self.tokens.revoke("deadpool@example.com")
+        self.assertFalse(await self.tokens.rotate("deadpool@example.com", "first", "second"))
+
+
+if __name__ == '__main__':
+    unittest.main()
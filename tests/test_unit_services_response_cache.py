@@ -0,0 +1,102 @@
+import unittest
+from datetime import datetime
+from typing import List
+from unittest.mock import patch
+
+import orjson
+from fakeredis.aioredis import FakeRedis
+from redis.exceptions import ConnectionError
+from starlette.requests import Request
+
+from src.database.models import Contact, User
+from src.schemas import ContactResponse
+from src.services.response_cache import ResponseCache
+
+
+SEED = 1_700_000_000_000
+
+
+def make_request(query: bytes = b'skip=0&limit=10') -> Request:
+    return Request({'type': 'http', 'method': 'GET', 'path': '/api/contacts', 'query_string': query, 'headers': []})
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis_db = FakeRedis()
+        self.cache = ResponseCache(self.redis_db, ttl=60)
+        self.user = User(id=1)
+        self.contacts = [Contact(id=1, first_name='John', last_name='Doe', email='john@example.com',
+                                 phone='0501234567', birthday=datetime(1990, 4, 1))]
+        clock = patch('src.services.response_cache.time.time', return_value=SEED / 1000)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    async def test_miss_then_hit(self):
+        slot, cached = await self.cache.get(make_request(), self.user)
+        self.assertIsNone(cached)
+        response = await self.cache.put(slot, List[ContactResponse], self.contacts, {'X-Next-Cursor': 'abc'})
+        self.assertEqual(orjson.loads(response.body)[0]['email'], 'john@example.com')
+        self.assertEqual(response.headers['ETag'], f'W/"1-{SEED}"')
+        self.assertLessEqual(await self.redis_db.ttl(slot.key), 60)
+        _, cached = await self.cache.get(make_request(b'limit=10&skip=0'), self.user)
+        self.assertEqual(cached.body, response.body)
+        self.assertEqual(cached.headers['X-Next-Cursor'], 'abc')
+        self.assertEqual(cached.headers['ETag'], f'W/"1-{SEED}"')
+
+    async def test_query_and_user_are_part_of_the_key(self):
+        slot, _ = await self.cache.get(make_request(), self.user)
+        await self.cache.put(slot, List[ContactResponse], self.contacts)
+        _, cached = await self.cache.get(make_request(b'skip=10&limit=10'), self.user)
+        self.assertIsNone(cached)
+        _, cached = await self.cache.get(make_request(), User(id=2))
+        self.assertIsNone(cached)
+
+    async def test_bump_invalidates(self):
+        slot, _ = await self.cache.get(make_request(), self.user)
+        await self.cache.put(slot, List[ContactResponse], self.contacts)
+        await self.cache.bump(self.user.id)
+        self.assertEqual(await self.cache.version(self.user.id), SEED + 1)
+        new_slot, cached = await self.cache.get(make_request(), self.user)
+        self.assertIsNone(cached)
+        self.assertNotEqual(new_slot.key, slot.key)
+        self.assertEqual(new_slot.etag, f'W/"1-{SEED + 1}"')
+
+    async def test_not_modified(self):
+        request = make_request()
+        request.scope['headers'] = [(b'if-none-match', f'W/"1-{SEED}"'.encode())]
+        slot, response = await self.cache.get(request, self.user)
+        self.assertIsNone(slot)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], f'W/"1-{SEED}"')
+        await self.cache.bump(self.user.id)
+        request = make_request()
+        request.scope['headers'] = [(b'if-none-match', f'W/"1-{SEED}"'.encode())]
+        slot, response = await self.cache.get(request, self.user)
+        self.assertEqual(slot.etag, f'W/"1-{SEED + 1}"')
+        self.assertIsNone(response)
+
+    async def test_versions_do_not_repeat_after_flush(self):
+        await self.cache.bump(self.user.id)
+        old_version = await self.cache.version(self.user.id)
+        await self.redis_db.flushall()
+        with patch('src.services.response_cache.time.time', return_value=SEED / 1000 + 1):
+            request = make_request()
+            request.scope['headers'] = [(b'if-none-match', self.cache.etag(self.user.id, old_version).encode())]
+            slot, response = await self.cache.get(request, self.user)
+        self.assertIsNone(response)
+        self.assertEqual(slot.etag, f'W/"1-{SEED + 1000}"')
+
+    async def test_redis_down_serves_uncached(self):
+        with patch.object(self.cache, 'lookup_script', side_effect=ConnectionError('down')):
+            slot, cached = await self.cache.get(make_request(), self.user)
+        self.assertIsNone(slot)
+        self.assertIsNone(cached)
+        response = await self.cache.put(slot, List[ContactResponse], self.contacts)
+        self.assertEqual(orjson.loads(response.body)[0]['id'], 1)
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(await self.redis_db.keys('*'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
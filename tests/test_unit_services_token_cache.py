@@ -0,0 +1,45 @@
+import time
+import unittest
+
+from src.services.token_cache import TokenCache
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TokenCache(max_size=2)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("token"))
+        self.cache.put("token", "deadpool@example.com", time.time() + 60)
+        self.assertEqual(self.cache.get("token"), "deadpool@example.com")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_expired(self):
+        self.cache.put("token", "deadpool@example.com", time.time() - 1)
+        self.assertIsNone(self.cache.get("token"))
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_keyed_by_digest(self):
+        self.cache.put("token", "deadpool@example.com", time.time() + 60)
+        self.assertNotIn("token", self.cache.entries)
+        self.assertIsNone(self.cache.get("token2"))
+
+    def test_lru_eviction(self):
+        for token in ("a", "b"):
+            self.cache.put(token, token, time.time() + 60)
+        self.cache.get("a")
+        self.cache.put("c", "c", time.time() + 60)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), "a")
+
+    def test_snapshot(self):
+        self.cache.put("token", "deadpool@example.com", time.time() + 60)
+        self.cache.get("token")
+        self.cache.get("other")
+        data = self.cache.snapshot()
+        self.assertEqual((data["size"], data["hits"], data["misses"], data["hit_ratio"]), (1, 1, 1, 0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import datetime
+import pickle
+import unittest
+
+from unittest.mock import AsyncMock
+
+from redis.exceptions import ConnectionError
+
+from src.database.models import User
+from src.services.user_cache import UserCache, LocalTier, encode_user, decode_user
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis_db = AsyncMock()
+        self.cache = UserCache(self.redis_db, ttl=900)
+        self.user = User(id=1, name="deadpool", email="deadpool@example.com", password="hash", confirmed=True,
+                         created_at=datetime.datetime(2023, 4, 23, 15, 28, 13), avatar=None)
+
+    def test_round_trip(self):
+        data = encode_user(self.user)
+        result = decode_user(data)
+        self.assertEqual((result.id, result.name, result.email, result.confirmed, result.created_at, result.avatar),
+                         (1, "deadpool", "deadpool@example.com", True, self.user.created_at, None))
+        self.assertIsNone(result.password)
+        self.assertLess(len(data), len(pickle.dumps(self.user)))
+
+    def test_decode_other_version(self):
+        self.assertIsNone(decode_user(b'[0, 1]'))
+
+    def test_decode_pickle(self):
+        self.assertIsNone(decode_user(pickle.dumps({"user": 1})))
+
+    async def test_get_local_hit(self):
+        await self.cache.set(self.user)
+        self.assertEqual((await self.cache.get("deadpool@example.com")).id, 1)
+        self.redis_db.get.assert_not_awaited()
+
+    async def test_get_miss(self):
+        self.redis_db.get.return_value = None
+        self.assertIsNone(await self.cache.get("deadpool@example.com"))
+
+    async def test_set_and_get_from_redis(self):
+        await self.cache.set(self.user)
+        key, data = self.redis_db.set.call_args.args
+        self.assertEqual(key, "user:deadpool@example.com")
+        self.assertEqual(self.redis_db.set.call_args.kwargs, {"ex": 900})
+        self.cache.local.clear()
+        self.redis_db.get.return_value = data
+        self.assertEqual((await self.cache.get("deadpool@example.com")).id, 1)
+        self.assertIsNotNone(self.cache.local.get("deadpool@example.com"))
+
+    async def test_invalidate(self):
+        await self.cache.invalidate("deadpool@example.com")
+        self.redis_db.delete.assert_awaited_once_with("user:deadpool@example.com")
+        self.redis_db.publish.assert_awaited_once_with(UserCache.CHANNEL, "deadpool@example.com")
+
+    async def test_redis_down(self):
+        self.redis_db.get.side_effect = ConnectionError('down')
+        self.redis_db.set.side_effect = ConnectionError('down')
+        self.redis_db.delete.side_effect = ConnectionError('down')
+        self.assertIsNone(await self.cache.get("deadpool@example.com"))
+        await self.cache.set(self.user)
+        self.assertEqual((await self.cache.get("deadpool@example.com")).id, 1)
+        await self.cache.invalidate("deadpool@example.com")
+        self.assertIsNone(await self.cache.get("deadpool@example.com"))
+
+    async def test_invalidation_message(self):
+        await self.cache.set(self.user)
+        self.cache.on_message({"type": "subscribe", "data": 1})
+        self.assertIsNotNone(self.cache.local.get("deadpool@example.com"))
+        self.cache.on_message({"type": "message", "data": b"deadpool@example.com"})
+        self.assertIsNone(self.cache.local.get("deadpool@example.com"))
+
+
+class TestLocalTier(unittest.TestCase):
+
+    def test_lru(self):
+        tier = LocalTier(max_size=2, ttl=60)
+        tier.put("a", b"1")
+        tier.put("b", b"2")
+        tier.get("a")
+        tier.put("c", b"3")
+        self.assertListEqual(list(tier.entries), ["a", "c"])
+
+    def test_ttl(self):
+        tier = LocalTier(max_size=2, ttl=-1)
+        tier.put("a", b"1")
+        self.assertIsNone(tier.get("a"))
+        self.assertEqual(len(tier.entries), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()